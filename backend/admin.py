@@ -1,13 +1,23 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact
+from backend.models import Shop, PriceListState, ImportRun, Category, Product, ProductInfo, Parameter, ProductParameter, ParameterFacet, CatalogEntry, Order, OrderItem, ShopOrder, Contact
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(PriceListState)
+class PriceListStateAdmin(admin.ModelAdmin):
+    pass
+
+
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+    pass
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     pass
@@ -33,6 +43,16 @@ class ProductParameterAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(ParameterFacet)
+class ParameterFacetAdmin(admin.ModelAdmin):
+    pass
+
+
+@admin.register(CatalogEntry)
+class CatalogEntryAdmin(admin.ModelAdmin):
+    pass
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     pass
@@ -43,6 +63,11 @@ class OrderItemAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(ShopOrder)
+class ShopOrderAdmin(admin.ModelAdmin):
+    pass
+
+
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
     pass
\ No newline at end of file
@@ -0,0 +1,105 @@
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.response import Response
+
+from backend.fast_serializers import aserialize_orders
+from backend.models import Order
+from backend.pagination import AsyncPageNumberPagination
+from backend.routers import replica_reads
+from backend.views import BasketView, CategoryView, ProductInfoView, ShopView, parse_product_filters
+
+
+class AsyncAPIViewMixin:
+    """
+    Асинхронный dispatch для представлений DRF.
+
+    Аутентификация, права и выбор формата ответа - initial синхронного представления (в потоке,
+    ReplicaReadMixin выбирает в нем реплику), обработчик get - корутина. Остальные методы
+    остаются у синхронных представлений
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        token = replica_reads.set(replica_reads.get())
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        finally:
+            replica_reads.reset(token)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListMixin(AsyncAPIViewMixin):
+    """
+    Асинхронный список с тем же запросом, постраничным выводом, кешем и ETag (CachedListMixin.alist),
+    что и у синхронного представления: строки страницы читаются асинхронным ORM
+    """
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+    async def alist_data(self, request, *args, **kwargs):
+        """
+        Данные ответа списка, как response.data у ListAPIView.list
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        return await sync_to_async(self.get_page_data)(page)
+
+    def get_page_data(self, page):
+        return self.get_paginated_response(self.get_serializer(page, many=True).data).data
+
+
+class AsyncCategoryView(AsyncListMixin, CategoryView):
+    """
+    Асинхронный список категорий
+    """
+    pagination_class = AsyncPageNumberPagination
+
+
+class AsyncShopView(AsyncListMixin, ShopView):
+    """
+    Асинхронный список магазинов
+    """
+    pagination_class = AsyncPageNumberPagination
+
+
+class AsyncProductInfoView(AsyncListMixin, ProductInfoView):
+    """
+    Асинхронный список предложений: фильтры, сортировка, курсор и facets те же, что у ProductInfoView
+    """
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.filters, self.parameter_filters = await sync_to_async(parse_product_filters)(request.query_params)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        return await self.alist(request, *args, **kwargs)
+
+
+class AsyncBasketView(AsyncAPIViewMixin, BasketView):
+    """
+    Асинхронный просмотр корзины
+    """
+    async def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        basket = Order.objects.filter(user_id=request.user.id, state='basket')
+        return Response(await aserialize_orders(basket))
@@ -0,0 +1,111 @@
+from django.db import transaction
+from django.db.models import F
+
+from backend.models import OrderItem, ProductInfo
+from backend.orders import refresh_order_totals
+
+
+def to_int(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def parse_basket_items(items):
+    """
+    Количество по ИД предложения из списка позиций {'product_info': ИД, 'quantity': количество},
+    повторяющиеся предложения суммируются. ValueError при ошибке формата
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('Ожидается непустой список позиций')
+
+    quantities = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(f'Неверная позиция: {item}')
+        product_info_id = to_int(item.get('product_info'))
+        quantity = to_int(item.get('quantity'))
+        if product_info_id is None or quantity is None or quantity < 1:
+            raise ValueError(f'Неверная позиция: {item}')
+        quantities[product_info_id] = quantities.get(product_info_id, 0) + quantity
+    return quantities
+
+
+def check_stock(quantities):
+    """
+    Ошибки по ИД предложения: нет такого предложения или не хватает остатка.
+    Все предложения проверяются одним запросом
+    """
+    available = dict(ProductInfo.objects.filter(id__in=quantities).values_list('id', 'quantity'))
+    errors = {}
+    for product_info_id, quantity in quantities.items():
+        if product_info_id not in available:
+            errors[product_info_id] = 'Предложение не найдено'
+        elif quantity > available[product_info_id]:
+            errors[product_info_id] = f'Недостаточно товара, в наличии {available[product_info_id]}'
+    return errors
+
+
+def add_basket_items(basket, quantities):
+    """
+    Запись позиций корзины одним INSERT ... ON CONFLICT по unique_order_item:
+    новые предложения добавляются, у уже лежащих в корзине заменяется количество.
+
+    Возвращает количество добавленных и обновленных позиций.
+    """
+    with transaction.atomic():
+        existing = set(OrderItem.objects.filter(order=basket, product_info_id__in=quantities)
+                       .values_list('product_info_id', flat=True))
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=basket, product_info_id=product_info_id, quantity=quantity)
+             for product_info_id, quantity in quantities.items()],
+            update_conflicts=True, unique_fields=['order', 'product_info'], update_fields=['quantity'])
+        refresh_order_totals([basket.id])
+    return len(quantities) - len(existing), len(existing)
+
+
+def update_basket_items(user, items):
+    """
+    Новое количество позиций корзины пользователя из списка {'id': ИД позиции, 'quantity': количество}:
+    одна выборка позиций с проверкой владельца и остатков и один UPDATE (bulk_update) в транзакции.
+    Позиции оформленных заказов не меняются: остаток под них уже зарезервирован.
+
+    Возвращает количество обновленных позиций и ошибки по позициям, при ошибках ничего не меняется.
+    """
+    quantities = {}
+    errors = {}
+    for number, item in enumerate(items):
+        item_id = to_int(item.get('id')) if isinstance(item, dict) else None
+        quantity = to_int(item.get('quantity')) if isinstance(item, dict) else None
+        if item_id is None:
+            errors[f'items[{number}]'] = 'Не указан ИД позиции'
+        elif quantity is None or quantity < 1:
+            errors[item_id] = 'Количество должно быть положительным целым числом'
+        else:
+            quantities[item_id] = quantity
+    if errors:
+        return 0, errors
+
+    with transaction.atomic():
+        order_items = list(OrderItem.objects.select_for_update(of=('self',))
+                           .filter(id__in=quantities, order__user=user).only('id', 'order_id', 'quantity')
+                           .annotate(available=F('product_info__quantity'), state=F('order__state')))
+        found = {order_item.id for order_item in order_items}
+        for item_id in quantities.keys() - found:
+            errors[item_id] = f'Order item with id {item_id} does not exist'
+        for order_item in order_items:
+            if order_item.state != 'basket':
+                errors[order_item.id] = 'Позиция оформленного заказа, количество не изменить'
+                continue
+            if quantities[order_item.id] > order_item.available:
+                errors[order_item.id] = f'Недостаточно товара, в наличии {order_item.available}'
+            order_item.quantity = quantities[order_item.id]
+        if errors:
+            return 0, errors
+        OrderItem.objects.bulk_update(order_items, ['quantity'])
+        refresh_order_totals({order_item.order_id for order_item in order_items})
+    return len(order_items), errors
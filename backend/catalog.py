@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+from django.db.models import OuterRef, Subquery
+
+from backend.models import CatalogEntry, ProductInfo, ProductParameter
+
+BATCH_SIZE = 1000
+
+
+def build_entries(product_info_ids):
+    """
+    Строки каталога для предложений: один запрос предложений с названиями и один запрос параметров
+    """
+    rows = ProductInfo.objects.filter(id__in=product_info_ids).order_by().values_list(
+        'id', 'shop_id', 'shop__state', 'product__category_id', 'product__name', 'product__category__name',
+        'model', 'quantity', 'price', 'price_rrc')
+
+    parameters = defaultdict(list)
+    product_parameters = ProductParameter.objects.filter(product_info_id__in=product_info_ids) \
+        .order_by('id').values_list('product_info_id', 'parameter__name', 'value')
+    for product_info_id, name, value in product_parameters:
+        parameters[product_info_id].append({'parameter': name, 'value': value})
+
+    return [
+        CatalogEntry(product_info_id=product_info_id, shop_id=shop_id, shop_state=shop_state,
+                     category_id=category_id, product_name=product_name, category_name=category_name,
+                     model=model, quantity=quantity, price=price, price_rrc=price_rrc,
+                     parameters=parameters[product_info_id])
+        for product_info_id, shop_id, shop_state, category_id, product_name, category_name,
+        model, quantity, price, price_rrc in rows
+    ]
+
+
+def refresh_catalog(product_info_ids, batch_size=BATCH_SIZE):
+    """
+    Пересборка строк каталога для измененных предложений, удаленные предложения удаляются из каталога.
+
+    Вызывается внутри транзакции импорта, поэтому каталог меняется вместе с предложениями.
+    """
+    product_info_ids = list(product_info_ids)
+    for start in range(0, len(product_info_ids), batch_size):
+        batch = product_info_ids[start:start + batch_size]
+        CatalogEntry.objects.filter(product_info_id__in=batch).delete()
+        CatalogEntry.objects.bulk_create(build_entries(batch))
+    return len(product_info_ids)
+
+
+def refresh_catalog_quantities(product_info_ids):
+    """
+    Остатки строк каталога из предложений одним UPDATE, после резерва товара при оформлении заказа
+    """
+    CatalogEntry.objects.filter(product_info_id__in=product_info_ids).update(
+        quantity=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('quantity')))
+
+
+def rebuild_catalog(shop_id=None, batch_size=BATCH_SIZE):
+    """
+    Полная пересборка каталога или каталога одного магазина
+    """
+    product_infos = ProductInfo.objects.order_by('id')
+    entries = CatalogEntry.objects.all()
+    if shop_id is not None:
+        product_infos = product_infos.filter(shop_id=shop_id)
+        entries = entries.filter(shop_id=shop_id)
+    entries.delete()
+    return refresh_catalog(product_infos.values_list('id', flat=True), batch_size)
+
+
+def set_shop_state(shops, state):
+    """
+    Статус магазинов из queryset shops в строках каталога
+    """
+    CatalogEntry.objects.filter(shop__in=shops).update(shop_state=state)
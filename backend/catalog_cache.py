@@ -0,0 +1,215 @@
+import time
+from contextlib import nullcontext
+from hashlib import md5
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from backend.checks import is_process_local
+from backend.routers import primary_reads, replica_reads
+
+GLOBAL_VERSION_KEY = 'catalog:version'
+REFERENCE_VERSION_KEY = 'catalog:reference-version'
+SHOP_VERSION_KEY = 'catalog:shop:{}:version'
+CHANGED_KEY = 'catalog:changed'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def version_timeout():
+    """
+    Время жизни счетчика версий: без ограничения в общем кеше. В кеше процесса (LocMemCache) увеличения
+    из других процессов не видны, поэтому счетчик живет CATALOG_LOCAL_VERSION_TIMEOUT секунд
+    и устаревший ответ отдается не дольше этого времени
+    """
+    if is_process_local(settings.CATALOG_CACHE_ALIAS):
+        return settings.CATALOG_LOCAL_VERSION_TIMEOUT
+    return None
+
+
+def get_versions(*keys):
+    """
+    Текущие значения счетчиков версий.
+
+    Отсутствующий счетчик создается со значением от текущего времени, чтобы после вытеснения
+    или перезапуска кеша версия не совпала с прежней и старые ответы не стали снова актуальными.
+    """
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = time.time_ns()
+            cache.add(key, version, version_timeout())
+            versions[key] = cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def _bump(*keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), version_timeout())
+    if settings.REPLICA_DATABASES:
+        cache.set(CHANGED_KEY, True, settings.REPLICA_STICKY_SECONDS)
+
+
+def recently_changed():
+    """
+    Каталог менялся последние REPLICA_STICKY_SECONDS секунд: реплики могут еще не получить изменения
+    """
+    return bool(settings.REPLICA_DATABASES) and bool(get_cache().get(CHANGED_KEY))
+
+
+def bump_shop(shop_id):
+    """
+    Новая версия каталога магазина и общего каталога после фиксации транзакции
+    """
+    transaction.on_commit(lambda: _bump(SHOP_VERSION_KEY.format(shop_id), GLOBAL_VERSION_KEY))
+
+
+def bump_reference():
+    """
+    Новая версия справочников (категории, товары, параметры), меняет ключи всех ответов
+    """
+    transaction.on_commit(lambda: _bump(REFERENCE_VERSION_KEY, GLOBAL_VERSION_KEY))
+
+
+def count(key):
+    try:
+        get_cache().incr(key)
+    except ValueError:
+        get_cache().add(key, 1, None)
+
+
+def cache_stats():
+    """
+    Попадания и промахи кеша ответов каталога
+    """
+    values = get_cache().get_many((HITS_KEY, MISSES_KEY))
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+    }
+
+
+class CachedListMixin:
+    """
+    Кеширование ответа списка по версиям каталога.
+
+    Ключ - представление, хост, значения cache_params из строки запроса и версии каталога:
+    общая версия или версия магазина при фильтре shop_id. Импорт и смена статуса магазина
+    увеличивают счетчики версий, поэтому сброс не требует перебора ключей.
+
+    ETag ответа строится из того же ключа, на If-None-Match с совпадающим ETag
+    возвращается 304 без запроса к базе данных и сериализации.
+
+    Импорт в Celery никого не закрепляет за основной базой, поэтому в первые REPLICA_STICKY_SECONDS
+    после увеличения версии ответ читается из основной базы: иначе отстающая реплика
+    закешировала бы старые данные под новой версией.
+    """
+    cache_params = ('page',)
+    cache_by_shop = False
+
+    def get_catalog_versions(self):
+        keys = [REFERENCE_VERSION_KEY]
+        shop_id = self.request.query_params.get('shop_id')
+        if self.cache_by_shop and shop_id and shop_id.isdigit():
+            keys.append(SHOP_VERSION_KEY.format(int(shop_id)))
+        else:
+            keys.append(GLOBAL_VERSION_KEY)
+        return get_versions(*keys)
+
+    def get_cache_key(self):
+        params = sorted((name, value) for name in self.cache_params
+                        for value in self.request.query_params.getlist(name) if value)
+        versions = ':'.join(str(version) for version in self.get_catalog_versions())
+        raw_key = f'{self.__class__.__name__}:{self.request.get_host()}:{versions}:{urlencode(params)}'
+        return 'catalog:response:' + md5(raw_key.encode()).hexdigest()
+
+    def get_etag(self, key):
+        """
+        Строгий ETag ответа: ключ кеша (версии каталога и параметры) и формат ответа
+        """
+        return '"{}"'.format(md5(f'{key}:{self.request.accepted_media_type}'.encode()).hexdigest())
+
+    def is_not_modified(self, etag):
+        if_none_match = self.request.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        etags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+        return '*' in etags or etag in etags
+
+    def not_modified(self, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+
+    def cached_response(self, data, etag, state):
+        response = Response(data)
+        response['X-Cache'] = state
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def read_database(self):
+        """
+        Чтение для промаха кеша: из основной базы, если каталог только что изменился и запрос читает из реплики
+        """
+        if replica_reads.get() and recently_changed():
+            return primary_reads()
+        return nullcontext()
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_cache_key()
+        etag = self.get_etag(key)
+        if self.is_not_modified(etag):
+            return self.not_modified(etag)
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is not None:
+            count(HITS_KEY)
+            return self.cached_response(data, etag, 'HIT')
+
+        count(MISSES_KEY)
+        with self.read_database():
+            data = super().list(request, *args, **kwargs).data
+        cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return self.cached_response(data, etag, 'MISS')
+
+    async def alist(self, request, *args, **kwargs):
+        """
+        list для асинхронных представлений: тот же ключ кеша, ETag и ответ,
+        при промахе данные страницы строит alist_data представления
+        """
+        key = await sync_to_async(self.get_cache_key)()
+        etag = self.get_etag(key)
+        if self.is_not_modified(etag):
+            return self.not_modified(etag)
+
+        cache = get_cache()
+        data = await cache.aget(key)
+        if data is not None:
+            await sync_to_async(count)(HITS_KEY)
+            return self.cached_response(data, etag, 'HIT')
+
+        await sync_to_async(count)(MISSES_KEY)
+        with await sync_to_async(self.read_database)():
+            data = await self.alist_data(request, *args, **kwargs)
+        await cache.aset(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return self.cached_response(data, etag, 'MISS')
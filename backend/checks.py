@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_process_local(alias):
+    """
+    Кеш виден только своему процессу: записи Celery не доходят до web и наоборот
+    """
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+def cache_uses():
+    """
+    Данные в кешах, которые пишет один процесс, а читают другие: (кеш, что хранится, номер проверки)
+    """
+    uses = [('default', 'import progress written by Celery workers is not visible to partner/import-status', 1),
+            (settings.CATALOG_CACHE_ALIAS, 'catalog versions bumped by imports in Celery workers never reach '
+                                           'the web processes, cached responses and ETags stay stale', 2)]
+    if settings.REPLICA_DATABASES:
+        uses.append(('default', 'a user pinned to the primary database after a write is pinned '
+                                'in one process only and reads stale data from replicas in the others', 3))
+    return uses
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Прогресс импорта, версии каталога и закрепление чтений за основной базой пишут одни процессы
+    (Celery, web), а читают другие, поэтому эти кеши должны быть общими для процессов
+    """
+    errors = []
+    for alias, problem, number in cache_uses():
+        if not is_process_local(alias):
+            continue
+        message = (f"CACHES['{alias}'] uses {settings.CACHES[alias]['BACKEND']}, "
+                   f"which is private to each process: {problem}.")
+        hint = 'Use a shared cache backend (file, Redis, Memcached) via CACHE_BACKEND and CACHE_LOCATION.'
+        if settings.DEBUG:
+            errors.append(Warning(message, hint=hint, id=f'backend.W00{number}'))
+        else:
+            errors.append(Error(message, hint=hint, id=f'backend.E00{number}'))
+    return errors
@@ -0,0 +1,93 @@
+import csv
+import io
+import zlib
+
+from ujson import dumps as dump_json
+
+from backend.models import CatalogEntry
+
+EXPORT_FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+CSV_COLUMNS = ('id', 'shop', 'category', 'category_name', 'name', 'model', 'price', 'price_rrc', 'quantity',
+               'parameters')
+
+ENTRY_FIELDS = ('product_info_id', 'shop_id', 'category_id', 'category_name', 'product_name', 'model', 'price',
+                'price_rrc', 'quantity', 'parameters')
+
+BUFFER_SIZE = 64 * 1024
+
+
+def export_entries(shop_id=None, category_id=None, chunk_size=2000):
+    """
+    Строки каталога активных магазинов в порядке ИД, читаются из базы частями по chunk_size
+    """
+    entries = CatalogEntry.objects.filter(shop_state=True)
+    if shop_id:
+        entries = entries.filter(shop_id=shop_id)
+    if category_id:
+        entries = entries.filter(category_id=category_id)
+    return entries.order_by('pk').values_list(*ENTRY_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def iter_jsonl(rows):
+    for product_info_id, shop_id, category_id, category_name, name, model, price, price_rrc, quantity, \
+            parameters in rows:
+        yield dump_json({
+            'id': product_info_id,
+            'model': model,
+            'product': {'name': name, 'category': category_name},
+            'category_id': category_id,
+            'shop': shop_id,
+            'quantity': quantity,
+            'price': price,
+            'price_rrc': price_rrc,
+            'product_parameters': parameters,
+        }, ensure_ascii=False, escape_forward_slashes=False) + '\n'
+
+
+def iter_csv(rows):
+    """
+    Строки CSV, параметры - JSON-объект {название: значение} в последней колонке
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        parameters = {parameter['parameter']: parameter['value'] for parameter in row[-1]}
+        writer.writerow(row[:-1] + (dump_json(parameters, ensure_ascii=False, escape_forward_slashes=False),))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_export(rows, export_format, compress=False, buffer_size=BUFFER_SIZE):
+    """
+    Поток байтов выгрузки: строки собираются в блоки по buffer_size и при compress сжимаются gzip на лету,
+    поэтому память не зависит от размера каталога
+    """
+    lines = iter_jsonl(rows) if export_format == 'jsonl' else iter_csv(rows)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def output(data):
+        return compressor.compress(data) if compressor else data
+
+    block = []
+    size = 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            chunk = output(''.join(block).encode())
+            if chunk:
+                yield chunk
+            block = []
+            size = 0
+    chunk = output(''.join(block).encode())
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
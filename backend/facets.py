@@ -0,0 +1,149 @@
+import math
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from backend import lookups
+from backend.models import ParameterFacet, ProductParameter
+
+facets_deferred = ContextVar('facets_deferred', default=False)
+
+FILTER_LOOKUPS = {
+    'param': 'value',
+    'param_min': 'value_num__gte',
+    'param_max': 'value_num__lte',
+}
+
+
+def parse_number(value):
+    """
+    Числовое значение параметра или None
+    """
+    try:
+        number = float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_parameter_filters(query_params):
+    """
+    Фильтры по параметрам из строки запроса: param=Название:значение,
+    param_min=Название:число и param_max=Название:число, каждый можно повторять.
+
+    Возвращает список (ИД параметра или None, lookup, значение), ValueError при ошибке формата.
+    """
+    parsed = []
+    for name, lookup in FILTER_LOOKUPS.items():
+        for raw in query_params.getlist(name):
+            parameter, separator, value = raw.partition(':')
+            if not separator or not parameter or not value:
+                raise ValueError(f'Фильтр {name} должен иметь вид Название:значение')
+            if lookup != 'value':
+                value = parse_number(value)
+                if value is None:
+                    raise ValueError(f'Значение фильтра {name} для "{parameter}" должно быть числом')
+            parsed.append((parameter, lookup, value))
+
+    parameter_ids = lookups.parameters.ids({parameter for parameter, _, _ in parsed})
+    return [(parameter_ids.get(parameter), lookup, value) for parameter, lookup, value in parsed]
+
+
+def filter_by_parameters(queryset, filters, field='id'):
+    """
+    Отбор предложений по параметрам: каждый фильтр - подзапрос по индексу (параметр, значение, предложение)
+    """
+    for parameter_id, lookup, value in filters:
+        if parameter_id is None:
+            return queryset.none()
+        product_info_ids = ProductParameter.objects.filter(parameter_id=parameter_id, **{lookup: value}) \
+            .values('product_info_id')
+        queryset = queryset.filter(**{f'{field}__in': product_info_ids})
+    return queryset
+
+
+def facet_counts(product_info_ids=None, shop_id=None, category_id=None):
+    """
+    Количество предложений по значениям параметров: {название параметра: {значение: количество}}.
+
+    Без фильтров по параметрам (product_info_ids=None) суммируются заранее посчитанные ParameterFacet
+    активных магазинов, иначе значения считаются по параметрам отобранных предложений.
+    """
+    if product_info_ids is None:
+        facets = ParameterFacet.objects.filter(shop__state=True)
+        if shop_id:
+            facets = facets.filter(shop_id=shop_id)
+        if category_id:
+            facets = facets.filter(category_id=category_id)
+        rows = facets.values_list('parameter_id', 'value').annotate(total=Sum('count')).order_by()
+    else:
+        rows = ProductParameter.objects.filter(product_info_id__in=product_info_ids) \
+            .values_list('parameter_id', 'value').annotate(total=Count('id')).order_by()
+
+    counts = defaultdict(dict)
+    rows = list(rows)
+    names = lookups.parameters.names({parameter_id for parameter_id, _, _ in rows})
+    for parameter_id, value, total in rows:
+        counts[names.get(parameter_id, parameter_id)][value] = total
+    return counts
+
+
+def rebuild_facets(shop_id):
+    """
+    Пересчет количества предложений магазина по категориям и значениям параметров
+    """
+    ParameterFacet.objects.filter(shop_id=shop_id).delete()
+    rows = ProductParameter.objects.filter(product_info__shop_id=shop_id) \
+        .values_list('product_info__product__category_id', 'parameter_id', 'value') \
+        .annotate(total=Count('id')).order_by()
+    ParameterFacet.objects.bulk_create([
+        ParameterFacet(shop_id=shop_id, category_id=category_id, parameter_id=parameter_id, value=value, count=total)
+        for category_id, parameter_id, value, total in rows
+    ], batch_size=1000)
+
+
+def parameter_facet_keys(product_parameters):
+    """
+    Ключи ParameterFacet (магазин, категория, параметр, значение) строк ProductParameter.
+    Внутри deferred_facets пустой список: количества пересчитываются после импорта
+    """
+    if facets_deferred.get():
+        return []
+    return list(product_parameters.values_list('product_info__shop_id', 'product_info__product__category_id',
+                                               'parameter_id', 'value'))
+
+
+def adjust_facets(removed=(), added=()):
+    """
+    Правка количеств ParameterFacet по ключам убранных и добавленных значений параметров
+    вместо пересчета всего магазина: строка с нулевым количеством удаляется, новое значение добавляет строку
+    """
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    with transaction.atomic():
+        for (shop_id, category_id, parameter_id, value), delta in deltas.items():
+            facets = ParameterFacet.objects.filter(shop_id=shop_id, category_id=category_id,
+                                                   parameter_id=parameter_id, value=value)
+            if delta > 0:
+                if not facets.update(count=F('count') + delta):
+                    ParameterFacet.objects.create(shop_id=shop_id, category_id=category_id,
+                                                  parameter_id=parameter_id, value=value, count=delta)
+            elif delta < 0:
+                facets.filter(count__lte=-delta).delete()
+                facets.update(count=F('count') + delta)
+
+
+@contextmanager
+def deferred_facets():
+    """
+    Блок импорта: изменения параметров не правят ParameterFacet построчно,
+    импорт пересчитывает количества магазина один раз (rebuild_facets)
+    """
+    token = facets_deferred.set(True)
+    try:
+        yield
+    finally:
+        facets_deferred.reset(token)
@@ -0,0 +1,133 @@
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from backend.models import Contact, OrderItem, ProductInfo, ProductParameter
+
+PRODUCT_INFO_FIELDS = ('id', 'model', 'product__name', 'product__category__name', 'shop_id', 'quantity', 'price',
+                       'price_rrc')
+
+CONTACT_FIELDS = ('id', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'phone')
+
+ORDER_FIELDS = ('id', 'state', 'dt', 'total_sum', 'contact_id')
+
+datetime_field = serializers.DateTimeField()
+
+
+def product_parameter_rows(product_info_ids):
+    return ProductParameter.objects.filter(product_info_id__in=product_info_ids).order_by('id') \
+        .values_list('product_info_id', 'parameter__name', 'value')
+
+
+def group_parameters(rows):
+    parameters = defaultdict(list)
+    for product_info_id, name, value in rows:
+        parameters[product_info_id].append({'parameter': name, 'value': value})
+    return parameters
+
+
+def product_parameters(product_info_ids):
+    """
+    Параметры предложений, сгруппированные по ИД предложения
+    """
+    return group_parameters(product_parameter_rows(product_info_ids))
+
+
+def format_product_infos(rows, parameters):
+    return [
+        {
+            'id': row['id'],
+            'model': row['model'],
+            'product': {'name': row['product__name'], 'category': row['product__category__name']},
+            'shop': row['shop_id'],
+            'quantity': row['quantity'],
+            'price': row['price'],
+            'price_rrc': row['price_rrc'],
+            'product_parameters': parameters[row['id']],
+        }
+        for row in rows
+    ]
+
+
+def serialize_product_infos(rows):
+    """
+    Предложения в формате ProductInfoSerializer из строк values(*PRODUCT_INFO_FIELDS)
+    """
+    rows = list(rows)
+    return format_product_infos(rows, product_parameters([row['id'] for row in rows]))
+
+
+def order_item_rows(order_rows, shop_ids=None):
+    items = OrderItem.objects.filter(order_id__in=[row['id'] for row in order_rows])
+    if shop_ids is not None:
+        items = items.filter(product_info__shop_id__in=shop_ids)
+    return items.order_by('id').values_list('id', 'order_id', 'product_info_id', 'quantity')
+
+
+def order_product_info_rows(item_rows):
+    return ProductInfo.objects.filter(id__in={row[2] for row in item_rows}).values(*PRODUCT_INFO_FIELDS)
+
+
+def order_contact_rows(order_rows):
+    return Contact.objects.filter(id__in={row['contact_id'] for row in order_rows} - {None}).values(*CONTACT_FIELDS)
+
+
+def format_orders(rows, item_rows, product_infos, contacts):
+    """
+    Заказы в формате OrderSerializer из уже выбранных строк заказов, позиций, предложений и контактов
+    """
+    product_infos = {product_info['id']: product_info for product_info in product_infos}
+    contacts = {contact['id']: contact for contact in contacts}
+    items = defaultdict(list)
+    for item_id, order_id, product_info_id, quantity in item_rows:
+        items[order_id].append({'id': item_id, 'product_info': product_infos[product_info_id],
+                                'quantity': quantity})
+
+    return [
+        {
+            'id': row['id'],
+            'ordered_items': items[row['id']],
+            'state': row['state'],
+            'dt': datetime_field.to_representation(row['dt']),
+            'total_sum': row['total_sum'],
+            'contact': contacts.get(row['contact_id']),
+        }
+        for row in rows
+    ]
+
+
+def serialize_orders(orders, shop_ids=None):
+    """
+    Заказы в формате OrderSerializer: один запрос заказов, позиций, предложений, параметров и контактов.
+    shop_ids оставляет в заказах только позиции этих магазинов
+    """
+    rows = list(orders.values(*ORDER_FIELDS))
+    item_rows = list(order_item_rows(rows, shop_ids))
+    return format_orders(rows, item_rows, serialize_product_infos(order_product_info_rows(item_rows)),
+                         order_contact_rows(rows))
+
+
+async def aserialize_orders(orders):
+    """
+    serialize_orders для асинхронных представлений: те же запросы через асинхронный ORM
+    """
+    rows = [row async for row in orders.values(*ORDER_FIELDS)]
+    item_rows = [row async for row in order_item_rows(rows)]
+    product_info_rows = [row async for row in order_product_info_rows(item_rows)]
+    parameter_rows = product_parameter_rows([row['id'] for row in product_info_rows])
+    parameters = group_parameters([row async for row in parameter_rows])
+    contacts = [row async for row in order_contact_rows(rows)]
+    return format_orders(rows, item_rows, format_product_infos(product_info_rows, parameters), contacts)
+
+
+class FastProductInfoSerializer:
+    """
+    Замена ProductInfoSerializer для списка строк values(*PRODUCT_INFO_FIELDS)
+    с тем же форматом ответа, без создания моделей и полей DRF
+    """
+    def __init__(self, instance, many=True, **kwargs):
+        self.instance = instance
+
+    @property
+    def data(self):
+        return serialize_product_infos(self.instance)
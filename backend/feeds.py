@@ -0,0 +1,311 @@
+import csv
+import os
+from hashlib import sha256
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
+
+from requests import get
+from ujson import loads as load_json
+from yaml import events, nodes
+
+try:
+    from yaml import CSafeLoader as FeedLoader
+except ImportError:
+    from yaml import SafeLoader as FeedLoader
+
+
+class FeedError(ValueError):
+    """
+    Ошибка формата прайс-листа
+    """
+
+
+FEED_CONTENT_TYPES = {
+    'application/x-ndjson': 'jsonl',
+    'application/ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+    'application/jsonlines': 'jsonl',
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/yaml': 'yaml',
+    'application/x-yaml': 'yaml',
+    'text/yaml': 'yaml',
+    'text/x-yaml': 'yaml',
+}
+
+FEED_EXTENSIONS = {
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+}
+
+CSV_FIELDS = ('shop', 'category', 'category_name', 'id', 'model', 'name', 'price', 'price_rrc', 'quantity')
+
+GOOD_INTEGER_FIELDS = ('id', 'category', 'price', 'price_rrc', 'quantity')
+
+
+class FeedDownload:
+    """
+    Результат условной загрузки прайс-листа.
+
+    decision: 'not_modified' - сервер ответил 304, 'unchanged' - хеш содержимого совпал с прошлой загрузкой,
+    'changed' - прайс-лист нужно импортировать из file.
+    """
+    def __init__(self, decision, file=None, etag='', last_modified='', digest='', size=0, downloaded=0,
+                 content_type=''):
+        self.decision = decision
+        self.file = file
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.size = size
+        self.downloaded = downloaded
+
+    @property
+    def changed(self):
+        return self.decision == 'changed'
+
+    def state_fields(self):
+        """
+        Поля для сохранения в PriceListState после импорта
+        """
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'digest': self.digest,
+            'size': self.size,
+        }
+
+    def summary(self):
+        return {
+            'decision': self.decision,
+            'bytes_downloaded': self.downloaded,
+            'bytes_saved': 0 if self.changed else self.size,
+        }
+
+
+def fetch_feed(url, state=None, chunk_size=64 * 1024, max_memory_size=8 * 1024 * 1024):
+    """
+    Загрузка прайс-листа с условными заголовками по сохраненному состоянию магазина.
+
+    Тело ответа пишется во временный файл (в памяти до max_memory_size, дальше на диске)
+    с подсчетом SHA-256, поэтому совпадающий по содержимому прайс-лист не разбирается повторно.
+    """
+    headers = {}
+    if state is not None and state.url == url:
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+
+    with get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return FeedDownload('not_modified', etag=state.etag, last_modified=state.last_modified,
+                                digest=state.digest, size=state.size)
+        response.raise_for_status()
+
+        file = SpooledTemporaryFile(max_size=max_memory_size)
+        digest = sha256()
+        size = 0
+        for chunk in response.iter_content(chunk_size):
+            digest.update(chunk)
+            file.write(chunk)
+            size += len(chunk)
+        file.seek(0)
+
+        download = FeedDownload('changed', file,
+                                etag=response.headers.get('ETag', ''),
+                                last_modified=response.headers.get('Last-Modified', ''),
+                                digest=digest.hexdigest(),
+                                size=size,
+                                downloaded=response.raw.tell(),
+                                content_type=response.headers.get('Content-Type', ''))
+
+    if state is not None and download.digest == state.digest:
+        file.close()
+        download.decision = 'unchanged'
+        download.file = None
+    return download
+
+
+def detect_format(url, content_type=''):
+    """
+    Формат прайс-листа по типу содержимого, затем по расширению в ссылке, по умолчанию YAML
+    """
+    media_type = content_type.split(';')[0].strip().lower()
+    if media_type in FEED_CONTENT_TYPES:
+        return FEED_CONTENT_TYPES[media_type]
+    extension = os.path.splitext(urlparse(url).path)[1].lower()
+    return FEED_EXTENSIONS.get(extension, 'yaml')
+
+
+def iter_feed(stream, feed_format):
+    """
+    Поток записей прайс-листа указанного формата
+    """
+    parsers = {'yaml': iter_yaml_feed, 'jsonl': iter_jsonl_feed, 'csv': iter_csv_feed}
+    if feed_format not in parsers:
+        raise FeedError(f'Неизвестный формат прайс-листа: {feed_format}')
+    return parsers[feed_format](stream)
+
+
+def validate_category(category):
+    """
+    Проверка и приведение типов категории
+    """
+    try:
+        return {'id': int(category['id']), 'name': str(category['name'])}
+    except (KeyError, TypeError, ValueError) as error:
+        raise FeedError(f'Неправильно указана категория {category}: {error}')
+
+
+def validate_good(item):
+    """
+    Проверка и приведение типов товара, общая для всех форматов
+    """
+    if not isinstance(item, dict):
+        raise FeedError(f'Товар должен быть словарем: {item}')
+    try:
+        good = {field: int(item[field]) for field in GOOD_INTEGER_FIELDS}
+        good['name'] = str(item['name'])
+    except KeyError as error:
+        raise FeedError(f'У товара {item.get("id")} не указано поле {error}')
+    except (TypeError, ValueError) as error:
+        raise FeedError(f'Неправильное значение у товара {item.get("id")}: {error}')
+
+    good['model'] = str(item.get('model') or '')
+    parameters = item.get('parameters') or {}
+    if not isinstance(parameters, dict):
+        raise FeedError(f'Параметры товара {good["id"]} должны быть словарем')
+    good['parameters'] = {str(name): value for name, value in parameters.items()}
+    return good
+
+
+def iter_feed_records(data):
+    """
+    Записи прайс-листа из уже загруженного словаря
+    """
+    yield 'shop', data['shop']
+    for category in data['categories']:
+        yield 'category', category
+    for item in data['goods']:
+        yield 'good', item
+
+
+def iter_yaml_feed(stream):
+    """
+    Потоковый разбор YAML прайс-листа по событиям парсера.
+
+    Товары собираются и отдаются по одному, поэтому память не зависит от размера файла.
+    """
+    loader = FeedLoader(stream)
+    try:
+        for event_class in (events.StreamStartEvent, events.DocumentStartEvent, events.MappingStartEvent):
+            if not loader.check_event(event_class):
+                raise FeedError('Прайс-лист должен быть YAML-словарем')
+            loader.get_event()
+
+        while not loader.check_event(events.MappingEndEvent):
+            key = _construct(loader, {})
+            if key in ('categories', 'goods') and loader.check_event(events.SequenceStartEvent):
+                kind = 'category' if key == 'categories' else 'good'
+                loader.get_event()
+                while not loader.check_event(events.SequenceEndEvent):
+                    yield kind, _construct(loader, {})
+                loader.get_event()
+            elif key == 'shop':
+                yield 'shop', _construct(loader, {})
+            else:
+                _construct(loader, {})
+    finally:
+        loader.dispose()
+
+
+def iter_jsonl_feed(stream):
+    """
+    Потоковый разбор прайс-листа JSON Lines: строка {"shop": ..., "categories": [...]}, затем по товару в строке
+    """
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = load_json(line)
+        except ValueError as error:
+            raise FeedError(f'Строка {number}: {error}')
+
+        if isinstance(value, dict) and 'shop' in value:
+            yield 'shop', value['shop']
+            for category in value.get('categories', ()):
+                yield 'category', category
+        else:
+            yield 'good', value
+
+
+def iter_csv_feed(stream):
+    """
+    Потоковый разбор прайс-листа CSV.
+
+    Колонки shop, category, category_name, id, model, name, price, price_rrc, quantity,
+    остальные колонки - параметры товара, пустые значения пропускаются.
+    """
+    reader = csv.DictReader(line.decode('utf-8-sig') for line in stream)
+    shop = None
+    categories = set()
+    for row in reader:
+        if shop is None:
+            shop = row.get('shop')
+            yield 'shop', shop
+        category = row.get('category')
+        if category not in categories and row.get('category_name'):
+            categories.add(category)
+            yield 'category', {'id': category, 'name': row['category_name']}
+
+        good = {field: row.get(field) for field in CSV_FIELDS[3:]}
+        good['category'] = category
+        good['parameters'] = {name: value for name, value in row.items()
+                              if name not in CSV_FIELDS and name is not None and value not in (None, '')}
+        yield 'good', good
+
+
+def _construct(loader, anchors):
+    """
+    Сборка одного значения из потока событий
+    """
+    event = loader.get_event()
+
+    if isinstance(event, events.AliasEvent):
+        if event.anchor not in anchors:
+            raise FeedError(f'Неизвестный якорь {event.anchor}')
+        return anchors[event.anchor]
+
+    if isinstance(event, events.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(nodes.ScalarNode, event.value, event.implicit)
+        constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+        value = constructor(loader, nodes.ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style))
+
+    elif isinstance(event, events.SequenceStartEvent):
+        value = []
+        while not loader.check_event(events.SequenceEndEvent):
+            value.append(_construct(loader, anchors))
+        loader.get_event()
+
+    elif isinstance(event, events.MappingStartEvent):
+        value = {}
+        while not loader.check_event(events.MappingEndEvent):
+            key = _construct(loader, anchors)
+            value[key] = _construct(loader, anchors)
+        loader.get_event()
+
+    else:
+        raise FeedError(f'Неожиданное событие YAML: {event}')
+
+    if event.anchor:
+        anchors[event.anchor] = value
+    return value
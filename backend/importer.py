@@ -0,0 +1,393 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+
+from backend import lookups
+from backend.catalog import refresh_catalog, refresh_catalog_quantities
+from backend.catalog_cache import bump_shop
+from backend.facets import deferred_facets, parse_number, rebuild_facets
+from backend.feeds import FeedError, validate_category, validate_good
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from backend.orders import deferred_order_totals, refresh_basket_totals
+
+PROGRESS_KEY = 'import-run:{}:progress'
+PROGRESS_TIMEOUT = 24 * 60 * 60
+
+
+def save_progress(run_id, importer):
+    """
+    Промежуточный прогресс запуска импорта.
+
+    Импорт идет в одной транзакции, поэтому обновления ImportRun не видны до ее завершения;
+    прогресс по пакетам пишется в кеш и читается оттуда, пока запуск выполняется.
+    Кеш default общий для web и Celery (проверка backend.E001).
+    """
+    cache.set(PROGRESS_KEY.format(run_id), {'rows': importer.rows, 'phases': importer.phase_stats()},
+              PROGRESS_TIMEOUT)
+
+
+def load_progress(run_id):
+    """
+    Промежуточный прогресс запуска импорта или None
+    """
+    return cache.get(PROGRESS_KEY.format(run_id))
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа поставщика пакетными запросами
+    """
+    batch_size = 1000
+    compared_fields = ('product_id', 'model', 'price', 'price_rrc', 'quantity')
+
+    def __init__(self, user_id, batch_size=None, mode='upsert', progress=None):
+        """
+        mode='upsert' сравнивает прайс-лист с текущими строками магазина по внешнему ИД
+        и записывает только изменения, строки, которых нет в прайс-листе, снимаются с продажи;
+        mode='replace' удаляет строки магазина и создает заново.
+        progress вызывается с импортером после каждого записанного пакета.
+        """
+        if mode not in ('upsert', 'replace'):
+            raise ValueError(f'Неизвестный режим импорта: {mode}')
+        self.user_id = user_id
+        self.batch_size = batch_size or self.batch_size
+        self.mode = mode
+        self.progress = progress
+        self.shop = None
+        self.categories = set()
+        self.shop_categories = None
+        self.products = {}
+        self.parameters = {}
+        self.rows = 0
+        self.parameter_rows = 0
+        self.existing = set()
+        self.seen = set()
+        self.added = 0
+        self.changed = 0
+        self.removed = 0
+        self.phases = defaultdict(float)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Учет времени этапа импорта
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.monotonic() - started
+
+    def timed(self, records):
+        """
+        Поток записей прайс-листа с учетом времени разбора
+        """
+        records = iter(records)
+        while True:
+            with self.phase('parse'):
+                record = next(records, None)
+            if record is None:
+                return
+            yield record
+
+    def import_categories(self, categories):
+        """
+        Создание недостающих категорий и привязка к магазину тех, что еще не привязаны
+        """
+        missing_ids = {category['id'] for category in categories} - self.categories
+        if missing_ids:
+            self.categories.update(lookups.categories.names(missing_ids))
+        missing = {category['id']: Category(id=category['id'], name=category['name'])
+                   for category in categories if category['id'] not in self.categories}
+        if missing:
+            lookups.categories.remember(Category.objects.bulk_create(missing.values()))
+            self.categories.update(missing)
+        if self.shop_categories is None:
+            self.shop_categories = set(self.shop.categories.values_list('id', flat=True))
+        links = {category['id'] for category in categories} - self.shop_categories
+        if links:
+            self.shop.categories.add(*links)
+            self.shop_categories.update(links)
+
+    def resolve_products(self, keys):
+        """
+        Поиск товаров по (названию, категории) в кеше справочников с созданием недостающих
+        """
+        missing = keys - self.products.keys()
+        if missing:
+            self.products.update(lookups.products.ids(missing))
+            missing -= self.products.keys()
+        if missing:
+            created = Product.objects.bulk_create([Product(name=name, category_id=category_id)
+                                                   for name, category_id in missing])
+            lookups.products.remember(created)
+            self.products.update({(product.name, product.category_id): product.id for product in created})
+
+    def resolve_parameters(self, names):
+        """
+        Поиск параметров по названию в кеше справочников с созданием недостающих
+        """
+        missing = names - self.parameters.keys()
+        if missing:
+            self.parameters.update(lookups.parameters.ids(missing))
+            missing -= self.parameters.keys()
+        if missing:
+            created = Parameter.objects.bulk_create([Parameter(name=name) for name in missing])
+            lookups.parameters.remember(created)
+            self.parameters.update({parameter.name: parameter.id for parameter in created})
+
+    def import_goods(self, goods):
+        """
+        Запись пакета товаров: недостающие товары и параметры, затем новые и изменившиеся строки.
+
+        Повторы внешнего ИД в прайс-листе пропускаются, неизменившиеся строки не записываются.
+        """
+        unique_goods = []
+        for item in goods:
+            if item['id'] not in self.seen:
+                self.seen.add(item['id'])
+                unique_goods.append(item)
+        goods = unique_goods
+
+        with self.phase('reference'):
+            self.resolve_products({(item['name'], item['category']) for item in goods})
+            self.resolve_parameters({name for item in goods for name in item['parameters']})
+        with self.phase('products'):
+            current = self.load_current(goods)
+
+            added = []
+            changed = []
+            parameters_changed = []
+            product_parameters = []
+            for item in goods:
+                parameters = {self.parameters[name]: str(value) for name, value in item['parameters'].items()}
+                product_info = ProductInfo(product_id=self.products[(item['name'], item['category'])],
+                                           external_id=item['id'],
+                                           model=item['model'],
+                                           price=item['price'],
+                                           price_rrc=item['price_rrc'],
+                                           quantity=item['quantity'],
+                                           shop_id=self.shop.id)
+                row = current.get(item['id'])
+                if row is None:
+                    added.append((product_info, parameters))
+                    continue
+
+                product_info.id = row['id']
+                if any(getattr(product_info, field) != row[field] for field in self.compared_fields):
+                    changed.append(product_info)
+                if parameters != row['parameters']:
+                    parameters_changed.append(product_info.id)
+                    product_parameters.extend(
+                        ProductParameter(product_info_id=product_info.id, parameter_id=parameter_id, value=value,
+                                         value_num=parse_number(value))
+                        for parameter_id, value in parameters.items()
+                    )
+
+            if added:
+                created = ProductInfo.objects.bulk_create([product_info for product_info, _ in added])
+                product_parameters.extend(
+                    ProductParameter(product_info_id=product_info.id, parameter_id=parameter_id, value=value,
+                                     value_num=parse_number(value))
+                    for product_info, (_, parameters) in zip(created, added)
+                    for parameter_id, value in parameters.items()
+                )
+            if changed:
+                ProductInfo.objects.bulk_update(changed, self.compared_fields, batch_size=self.batch_size)
+
+        with self.phase('parameters'):
+            if parameters_changed:
+                ProductParameter.objects.filter(product_info_id__in=parameters_changed).delete()
+            if product_parameters:
+                ProductParameter.objects.bulk_create(product_parameters, batch_size=self.batch_size)
+
+        changed_ids = {product_info.id for product_info in changed}.union(parameters_changed)
+        with self.phase('catalog'):
+            refresh_catalog([product_info.id for product_info, _ in added] + list(changed_ids))
+            refresh_basket_totals([product_info.id for product_info in changed])
+
+        self.rows += len(goods)
+        self.parameter_rows += len(product_parameters)
+        self.added += len(added)
+        self.changed += len(changed_ids)
+
+    def load_current(self, goods):
+        """
+        Текущие строки магазина с параметрами для пакета товаров, ключ - внешний ИД
+        """
+        if self.mode == 'replace':
+            return {}
+
+        current = {
+            row['external_id']: dict(row, parameters={})
+            for row in ProductInfo.objects.filter(shop_id=self.shop.id,
+                                                  external_id__in=[item['id'] for item in goods])
+                                          .values('id', 'external_id', *self.compared_fields)
+        }
+        by_id = {row['id']: row for row in current.values()}
+        product_parameters = ProductParameter.objects.filter(product_info_id__in=by_id.keys()) \
+            .values_list('product_info_id', 'parameter_id', 'value')
+        for product_info_id, parameter_id, value in product_parameters:
+            by_id[product_info_id]['parameters'][parameter_id] = value
+        return current
+
+    def remove_missing(self, external_ids=None):
+        """
+        Снятие с продажи строк магазина, которых нет в новом прайс-листе: остаток обнуляется,
+        а сами строки остаются, поэтому позиции корзин и заказов на них не удаляются каскадом.
+        Уже снятые строки не записываются повторно
+        """
+        missing = list(self.existing - self.seen) if external_ids is None else list(external_ids)
+        for start in range(0, len(missing), self.batch_size):
+            ids = list(ProductInfo.objects.filter(shop_id=self.shop.id, quantity__gt=0,
+                                                  external_id__in=missing[start:start + self.batch_size])
+                       .values_list('id', flat=True))
+            if ids:
+                ProductInfo.objects.filter(id__in=ids).update(quantity=0)
+                refresh_catalog_quantities(ids)
+            self.removed += len(ids)
+
+    def iter_goods(self, records):
+        """
+        Обработка магазина и категорий из потока записей, возвращает проверенные товары
+        """
+        categories = []
+        for kind, value in self.timed(records):
+            if kind == 'shop':
+                if not value:
+                    raise FeedError('Не указано название магазина')
+                with self.phase('reference'):
+                    self.shop, _ = Shop.objects.get_or_create(name=value, user_id=self.user_id)
+                    if self.mode == 'replace':
+                        with deferred_order_totals():
+                            _, deleted = ProductInfo.objects.filter(shop_id=self.shop.id).delete()
+                        self.removed = deleted.get(ProductInfo._meta.label, 0)
+                    else:
+                        self.existing = set(ProductInfo.objects.filter(shop_id=self.shop.id)
+                                            .values_list('external_id', flat=True))
+                continue
+
+            if self.shop is None:
+                raise FeedError('Магазин должен быть указан в начале прайс-листа')
+
+            if kind == 'category':
+                categories.append(validate_category(value))
+            elif kind == 'good':
+                if categories:
+                    with self.phase('reference'):
+                        self.import_categories(categories)
+                    categories = []
+                yield validate_good(value)
+
+        if self.shop is None:
+            raise FeedError('В прайс-листе не указан магазин')
+        if categories:
+            with self.phase('reference'):
+                self.import_categories(categories)
+
+    def run(self, records):
+        """
+        Импорт потока записей прайс-листа в одной транзакции, возвращает статистику загрузки
+        """
+        started = time.monotonic()
+        with self.phase('reference'):
+            lookups.refresh_reference_caches()
+        with transaction.atomic(), deferred_facets():
+            batch = []
+            for item in self.iter_goods(records):
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self.import_goods(batch)
+                    self.report_progress()
+                    batch = []
+            if batch:
+                self.import_goods(batch)
+                self.report_progress()
+            if self.mode == 'upsert':
+                with self.phase('cleanup'):
+                    self.remove_missing()
+            if self.added or self.changed or self.removed or self.mode == 'replace':
+                with self.phase('facets'):
+                    rebuild_facets(self.shop.id)
+            bump_shop(self.shop.id)
+
+        return self.stats(time.monotonic() - started)
+
+    def prepare(self, records):
+        """
+        Первый проход для параллельного импорта: магазин, категории, товары и параметры создаются заранее,
+        чтобы части прайс-листа не создавали их одновременно.
+
+        Возвращает число уникальных товаров и внешние ИД, которых нет в прайс-листе.
+        """
+        with self.phase('reference'):
+            lookups.refresh_reference_caches()
+        with transaction.atomic():
+            product_keys = set()
+            parameter_names = set()
+            for item in self.iter_goods(records):
+                if item['id'] in self.seen:
+                    continue
+                self.seen.add(item['id'])
+                product_keys.add((item['name'], item['category']))
+                parameter_names.update(item['parameters'])
+                with self.phase('reference'):
+                    if len(product_keys) >= self.batch_size:
+                        self.resolve_products(product_keys)
+                        product_keys = set()
+                    if len(parameter_names) >= self.batch_size:
+                        self.resolve_parameters(parameter_names)
+                        parameter_names = set()
+            with self.phase('reference'):
+                self.resolve_products(product_keys)
+                self.resolve_parameters(parameter_names)
+            bump_shop(self.shop.id)
+
+        return {
+            'shop_id': self.shop.id,
+            'goods': len(self.seen),
+            'removed': sorted(self.existing - self.seen) if self.mode == 'upsert' else [],
+        }
+
+    def run_chunk(self, shop, goods):
+        """
+        Импорт части товаров прайс-листа, подготовленного методом prepare
+        """
+        started = time.monotonic()
+        self.shop = shop
+        with self.phase('reference'):
+            lookups.refresh_reference_caches()
+        with transaction.atomic(), deferred_facets():
+            for start in range(0, len(goods), self.batch_size):
+                self.import_goods(goods[start:start + self.batch_size])
+            bump_shop(self.shop.id)
+        return self.stats(time.monotonic() - started)
+
+    def report_progress(self):
+        if self.progress is not None:
+            self.progress(self)
+
+    def phase_stats(self):
+        return {name: round(seconds, 3) for name, seconds in self.phases.items()}
+
+    def stats(self, elapsed):
+        """
+        Статистика загрузки
+        """
+        return {
+            'shop': self.shop.name,
+            'rows': self.rows,
+            'parameter_rows': self.parameter_rows,
+            'mode': self.mode,
+            'added': self.added,
+            'changed': self.changed,
+            'unchanged': self.rows - self.added - self.changed,
+            'removed': self.removed,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else self.rows,
+            'phases': self.phase_stats(),
+            'lookup_cache': lookups.reference_cache_stats(),
+        }
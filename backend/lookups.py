@@ -0,0 +1,189 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from backend.models import Category, Parameter, Product
+
+REFRESH_BATCH_SIZE = 5000
+
+
+class ReferenceCache:
+    """
+    Кеш справочника в памяти процесса: ключ (название) -> ИД и ИД -> название.
+
+    Размер ограничен, давно не использованные записи вытесняются (LRU). В базу данных
+    запросы идут только за отсутствующими в кеше записями.
+    """
+    def __init__(self, model, key_fields, maxsize=None):
+        self.model = model
+        self.key_fields = key_fields
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._keys = OrderedDict()
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get_maxsize(self):
+        return self.maxsize or settings.REFERENCE_CACHE_SIZE
+
+    def key_of(self, row):
+        """
+        Ключ записи: название или кортеж полей для составного ключа
+        """
+        if len(self.key_fields) == 1:
+            return row[0]
+        return tuple(row)
+
+    def _store(self, rows):
+        with self._lock:
+            for object_id, *fields in rows:
+                key = self.key_of(fields)
+                old_key = self._keys.pop(object_id, None)
+                if old_key is not None:
+                    self._ids.pop(old_key, None)
+                self._keys[object_id] = key
+                self._ids[key] = object_id
+            while len(self._keys) > self.get_maxsize():
+                _, key = self._keys.popitem(last=False)
+                self._ids.pop(key, None)
+
+    def ids(self, keys):
+        """
+        ИД по ключам, отсутствующие в базе ключи не возвращаются
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                object_id = self._ids.get(key)
+                if object_id is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self._keys.move_to_end(object_id)
+                found[key] = object_id
+
+        missing = set(keys) - found.keys()
+        if missing:
+            first_values = {key if len(self.key_fields) == 1 else key[0] for key in missing}
+            rows = [row for row in self.model.objects.filter(**{f'{self.key_fields[0]}__in': first_values})
+                    .order_by().values_list('id', *self.key_fields)
+                    if self.key_of(row[1:]) in missing]
+            self.store(rows)
+            found.update((self.key_of(row[1:]), row[0]) for row in rows)
+        return found
+
+    def names(self, object_ids):
+        """
+        Названия по ИД, отсутствующие в базе ИД не возвращаются
+        """
+        found = {}
+        with self._lock:
+            for object_id in object_ids:
+                key = self._keys.get(object_id)
+                if key is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self._keys.move_to_end(object_id)
+                found[object_id] = key if len(self.key_fields) == 1 else key[0]
+
+        missing = set(object_ids) - found.keys()
+        if missing:
+            rows = list(self.model.objects.filter(id__in=missing).order_by().values_list('id', *self.key_fields))
+            self.store(rows)
+            found.update((row[0], row[1]) for row in rows)
+        return found
+
+    def name(self, object_id):
+        return self.names([object_id]).get(object_id)
+
+    def store(self, rows):
+        """
+        Добавление строк (ИД, *поля ключа) в кеш после фиксации текущей транзакции,
+        чтобы в кеш не попали записи из отмененной транзакции
+        """
+        transaction.on_commit(lambda: self._store(rows))
+
+    def remember(self, objects):
+        self.store([(obj.id, *(getattr(obj, field) for field in self.key_fields)) for obj in objects])
+
+    def invalidate(self, instance):
+        with self._lock:
+            key = self._keys.pop(instance.id, None)
+            if key is not None:
+                self._ids.pop(key, None)
+            current_key = self.key_of([getattr(instance, field) for field in self.key_fields])
+            if self._ids.get(current_key) == instance.id:
+                self._ids.pop(current_key)
+
+    def refresh(self):
+        """
+        Сверка кеша с базой данных: записи, удаленные или переименованные в другом процессе
+        (сигналы приходят только в свой процесс), вытесняются. Возвращает число вытесненных записей
+        """
+        with self._lock:
+            cached = dict(self._keys)
+        object_ids = list(cached)
+        current = {}
+        for start in range(0, len(object_ids), REFRESH_BATCH_SIZE):
+            current.update((row[0], self.key_of(row[1:])) for row in
+                           self.model.objects.filter(id__in=object_ids[start:start + REFRESH_BATCH_SIZE])
+                           .order_by().values_list('id', *self.key_fields))
+
+        stale = 0
+        with self._lock:
+            for object_id, key in cached.items():
+                if current.get(object_id) != key and self._keys.get(object_id) == key:
+                    del self._keys[object_id]
+                    if self._ids.get(key) == object_id:
+                        del self._ids[key]
+                    stale += 1
+        return stale
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._ids.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._keys),
+            'maxsize': self.get_maxsize(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 3) if requests else None,
+        }
+
+
+parameters = ReferenceCache(Parameter, ('name',))
+categories = ReferenceCache(Category, ('name',))
+products = ReferenceCache(Product, ('name', 'category_id'))
+
+REFERENCE_CACHES = {
+    Parameter: parameters,
+    Category: categories,
+    Product: products,
+}
+
+
+def reference_cache_stats():
+    """
+    Попадания и промахи кешей справочников
+    """
+    return {model._meta.model_name: cache.stats() for model, cache in REFERENCE_CACHES.items()}
+
+
+def refresh_reference_caches():
+    """
+    Сверка кешей справочников с базой данных перед импортом
+    """
+    return {model._meta.model_name: cache.refresh() for model, cache in REFERENCE_CACHES.items()}
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import Order
+from backend.orders import refresh_order_totals
+
+
+class Command(BaseCommand):
+    help = ('Пересчет сохраненных сумм и количества позиций корзин по текущим позициям и ценам. '
+            'Суммы оформленных заказов фиксируются при оформлении и пересчитываются только с --all')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Заказов в одном UPDATE')
+        parser.add_argument('--all', action='store_true',
+                            help='Пересчитать и оформленные заказы по текущим ценам')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.order_by('pk')
+        if not options['all']:
+            orders = orders.filter(state='basket')
+        order_ids = list(orders.values_list('pk', flat=True))
+
+        batch_size = options['batch_size']
+        for start in range(0, len(order_ids), batch_size):
+            refresh_order_totals(order_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано заказов: {len(order_ids)}'))
@@ -0,0 +1,94 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from requests import Session
+from requests.exceptions import RequestException
+
+# (название, путь синхронного представления, путь асинхронного представления)
+ENDPOINTS = (
+    ('categories', '/api/v1/categories', '/api/v1/async/categories'),
+    ('shops', '/api/v1/shops', '/api/v1/async/shops'),
+    ('products', '/api/v1/products?page_size=100', '/api/v1/async/products?page_size=100'),
+    ('basket', '/api/v1/basket', '/api/v1/async/basket'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Сравнение пропускной способности синхронных (WSGI) и асинхронных (ASGI) представлений ' \
+           'под параллельной нагрузкой на запущенных серверах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-url', default='http://127.0.0.1:8000',
+                            help='Сервер WSGI, например python manage.py runserver 8000')
+        parser.add_argument('--async-url', default='http://127.0.0.1:8001',
+                            help='Сервер ASGI, например uvicorn shop.asgi:application --port 8001')
+        parser.add_argument('--concurrency', type=int, default=50, help='Одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=500, help='Запросов к каждому адресу')
+        parser.add_argument('--token', help='Токен покупателя для корзины, без него корзина пропускается')
+        parser.add_argument('--output', '-o', default='concurrency_benchmark.json', help='Файл JSON отчета')
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f"Token {options['token']}"} if options['token'] else {}
+        results = {}
+        for name, sync_path, async_path in ENDPOINTS:
+            if name == 'basket' and not headers:
+                continue
+            results[name] = {
+                'sync': self.measure(options['sync_url'] + sync_path, headers, options),
+                'async': self.measure(options['async_url'] + async_path, headers, options),
+            }
+            sync, asynchronous = results[name]['sync'], results[name]['async']
+            self.stdout.write(f"{name}: WSGI {sync['rps']} запр/с (p95 {sync['p95']} с), "
+                              f"ASGI {asynchronous['rps']} запр/с (p95 {asynchronous['p95']} с)")
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'sync_url': options['sync_url'],
+            'async_url': options['async_url'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
+
+    def measure(self, url, headers, options):
+        """
+        requests запросов к url из concurrency потоков: запросов в секунду, задержки и ошибки
+        """
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'session'):
+                local.session = Session()
+            started = time.perf_counter()
+            try:
+                response = local.session.get(url, headers=headers, timeout=60)
+                ok = response.status_code == 200
+            except RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        if not fetch(None)[1]:
+            raise CommandError(f'{url}: сервер недоступен или вернул ошибку')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            samples = list(executor.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, ok in samples if ok)
+        if not latencies:
+            raise CommandError(f'{url}: нет успешных ответов')
+        return {
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50': round(statistics.median(latencies), 4),
+            'p95': round(latencies[int(len(latencies) * 0.95) - 1], 4),
+            'errors': len(samples) - len(latencies),
+        }
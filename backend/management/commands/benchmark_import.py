@@ -0,0 +1,115 @@
+import functools
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from backend.management.commands.generate_pricelist import write_pricelist
+from shop.tasks import do_import
+from users.models import User
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости импорта прайс-листов на синтетических данных во временной базе SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, nargs='+', default=[1000, 10000],
+                            help='Размеры прайс-листов в товарах')
+        parser.add_argument('--parameters', type=int, default=4, help='Параметров у товара')
+        parser.add_argument('--categories', type=int, default=10, help='Количество категорий')
+        parser.add_argument('--mode', choices=('upsert', 'replace'), default='upsert')
+        parser.add_argument('--format', dest='feed_format', choices=('yaml', 'jsonl', 'csv'), default='yaml')
+        parser.add_argument('--sqlite-file', help='Файл временной базы, по умолчанию база в памяти')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Пик памяти Python по tracemalloc (замедляет импорт в несколько раз)')
+        parser.add_argument('--output', '-o', default='import_benchmark.json', help='Файл JSON отчета')
+
+    def handle(self, *args, **options):
+        if options['sqlite_file']:
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = options['sqlite_file']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                try:
+                    runs = [self.benchmark(directory, server.server_port, goods, options)
+                            for goods in options['goods']]
+                finally:
+                    server.shutdown()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'parameters': options['parameters'],
+            'categories': options['categories'],
+            'mode': options['mode'],
+            'format': options['feed_format'],
+            'runs': runs,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
+
+    def benchmark(self, directory, port, goods, options):
+        """
+        Первичный импорт и повторный импорт того же прайс-листа для одного размера
+        """
+        file_name = f"pricelist-{goods}.{options['feed_format']}"
+        path = os.path.join(directory, file_name)
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            write_pricelist(file, goods, options['parameters'], options['categories'],
+                            shop=f'Магазин {goods}', feed_format=options['feed_format'])
+
+        user = User.objects.create(email=f'benchmark-{goods}@example.com', type='shop', is_active=True)
+        url = f'http://127.0.0.1:{port}/{file_name}'
+        run = {'goods': goods, 'feed_bytes': os.path.getsize(path)}
+        for name in ('initial', 'reimport'):
+            run[name] = self.measure(url, user.id, options['mode'], options['trace_memory'])
+            self.stdout.write(f"{goods} товаров, {name}: {run[name]['rows_per_second']} строк/с, "
+                              f"{run[name]['queries']} запросов, пик RSS {run[name]['peak_rss_kb']} КБ")
+        return run
+
+    def measure(self, url, user_id, mode, trace_memory=False):
+        """
+        Импорт с подсчетом запросов, пиковой памяти и времени этапов.
+
+        peak_rss_kb - максимум RSS процесса после импорта (Linux), peak_traced_kb - пик по tracemalloc.
+        """
+        if trace_memory:
+            tracemalloc.start()
+        started = time.monotonic()
+        with CaptureQueriesContext(connection) as queries:
+            result = do_import(url, user_id, mode=mode, force=True, sharded=False)
+        elapsed = time.monotonic() - started
+        measurement = {
+            'seconds': round(elapsed, 3),
+            'rows': result['rows'],
+            'rows_per_second': round(result['rows'] / elapsed, 1),
+            'queries': len(queries),
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'phases': result['phases'],
+            'added': result['added'],
+            'changed': result['changed'],
+            'removed': result['removed'],
+        }
+        if trace_memory:
+            measurement['peak_traced_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        return measurement
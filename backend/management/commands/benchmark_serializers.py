@@ -0,0 +1,115 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from backend.fast_serializers import PRODUCT_INFO_FIELDS, serialize_orders, serialize_product_infos
+from backend.feeds import iter_feed_records
+from backend.importer import PriceListImporter
+from backend.management.commands.generate_pricelist import generate_goods
+from backend.models import Contact, Order, OrderItem, ProductInfo
+from backend.serializers import OrderSerializer, ProductInfoSerializer
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сравнение быстрой сериализации предложений и заказов с сериализаторами DRF: совпадение JSON и время'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=2000, help='Количество предложений')
+        parser.add_argument('--parameters', type=int, default=4, help='Параметров у товара')
+        parser.add_argument('--orders', type=int, default=200, help='Количество заказов')
+        parser.add_argument('--items', type=int, default=5, help='Позиций в заказе')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов замера, берется лучшее время')
+        parser.add_argument('--output', '-o', default='serializer_benchmark.json', help='Файл JSON отчета')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.create_data(options)
+            cases = {
+                'products': (
+                    lambda: ProductInfoSerializer(
+                        ProductInfo.objects.select_related('shop', 'product')
+                        .prefetch_related('product_parameters').order_by('id'), many=True).data,
+                    lambda: serialize_product_infos(ProductInfo.objects.order_by('id').values(*PRODUCT_INFO_FIELDS)),
+                ),
+                'orders': (
+                    lambda: OrderSerializer(
+                        self.orders().prefetch_related('order_items__product_info__product',
+                                                       'order_items__product_info__product_parameters')
+                        .select_related('contact'), many=True).data,
+                    lambda: serialize_orders(self.orders()),
+                ),
+            }
+            results = {name: self.compare(name, drf, fast, options['repeat'])
+                       for name, (drf, fast) in cases.items()}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'goods': options['goods'],
+            'parameters': options['parameters'],
+            'orders': options['orders'],
+            'items': options['items'],
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
+
+    def create_data(self, options):
+        """
+        Синтетические предложения через импорт и заказы покупателя с контактами
+        """
+        user = User.objects.create(email='benchmark-shop@example.com', type='shop', is_active=True)
+        data = {
+            'shop': 'Магазин',
+            'categories': [{'id': number, 'name': f'Категория {number}'} for number in range(1, 11)],
+            'goods': generate_goods(options['goods'], options['parameters'], 10),
+        }
+        PriceListImporter(user.id).run(iter_feed_records(data))
+
+        buyer = User.objects.create(email='benchmark-buyer@example.com', type='buyer', is_active=True)
+        contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', house='1', phone='+70000000000')
+        product_info_ids = list(ProductInfo.objects.values_list('id', flat=True))
+        rnd = random.Random(0)
+        orders = Order.objects.bulk_create([
+            Order(user=buyer, state='new', contact=contact if number % 2 else None)
+            for number in range(options['orders'])
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info_id=product_info_id, quantity=rnd.randint(1, 5))
+            for order in orders
+            for product_info_id in rnd.sample(product_info_ids, min(options['items'], len(product_info_ids)))
+        ])
+
+    def orders(self):
+        return Order.objects.exclude(state='basket')
+
+    def compare(self, name, drf, fast, repeat):
+        """
+        Проверка совпадения JSON и лучшее время из repeat запусков для каждого способа
+        """
+        renderer = JSONRenderer()
+        if renderer.render(drf()) != renderer.render(fast()):
+            raise CommandError(f'{name}: быстрая сериализация не совпадает с DRF')
+
+        timings = {}
+        for method, function in (('drf', drf), ('fast', fast)):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                renderer.render(function())
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[method] = round(best, 4)
+        timings['speedup'] = round(timings['drf'] / timings['fast'], 1) if timings['fast'] else None
+        self.stdout.write(f"{name}: DRF {timings['drf']} с, быстрая {timings['fast']} с, "
+                          f"ускорение {timings['speedup']}x")
+        return timings
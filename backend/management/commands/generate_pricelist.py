@@ -0,0 +1,100 @@
+import csv
+import random
+import sys
+
+import yaml
+from django.core.management.base import BaseCommand
+from ujson import dumps as dump_json
+
+from backend.feeds import CSV_FIELDS
+
+PARAMETERS = (
+    ('Цвет', lambda rnd: rnd.choice(('черный', 'белый', 'серебристый', 'золотистый', 'красный', 'синий'))),
+    ('Встроенная память (Гб)', lambda rnd: rnd.choice((16, 32, 64, 128, 256, 512))),
+    ('Диагональ (дюйм)', lambda rnd: round(rnd.uniform(4, 80), 1)),
+    ('Разрешение (пикс)', lambda rnd: rnd.choice(('1920x1080', '2688x1242', '1792x828', '3840x2160'))),
+)
+
+
+def generate_goods(goods, parameters, categories, seed=0):
+    """
+    Синтетические товары в формате data/shop.yaml
+    """
+    rnd = random.Random(seed)
+    for index in range(1, goods + 1):
+        price = rnd.randrange(500, 200000, 10)
+        item_parameters = {}
+        for number, name in enumerate(parameter_names(parameters)):
+            if number < len(PARAMETERS):
+                item_parameters[name] = PARAMETERS[number][1](rnd)
+            else:
+                item_parameters[name] = f'значение {rnd.randint(1, 20)}'
+        yield {
+            'id': index,
+            'category': rnd.randint(1, categories),
+            'model': f'synthetic/model-{index % 1000}',
+            'name': f'Товар {index}',
+            'price': price,
+            'price_rrc': price + rnd.randrange(0, 10000, 10),
+            'quantity': rnd.randint(0, 100),
+            'parameters': item_parameters,
+        }
+
+
+def parameter_names(parameters):
+    return [PARAMETERS[number][0] if number < len(PARAMETERS) else f'Параметр {number}'
+            for number in range(parameters)]
+
+
+def write_pricelist(file, goods, parameters=4, categories=10, shop='Синтетический магазин', seed=0,
+                    feed_format='yaml'):
+    """
+    Запись синтетического прайс-листа в формате yaml, jsonl или csv по одному товару,
+    без построения всего документа в памяти
+    """
+    category_list = [{'id': number, 'name': f'Категория {number}'} for number in range(1, categories + 1)]
+    items = generate_goods(goods, parameters, categories, seed)
+
+    if feed_format == 'jsonl':
+        file.write(dump_json({'shop': shop, 'categories': category_list}, ensure_ascii=False) + '\n')
+        for item in items:
+            file.write(dump_json(item, ensure_ascii=False) + '\n')
+
+    elif feed_format == 'csv':
+        names = parameter_names(parameters)
+        writer = csv.writer(file)
+        writer.writerow(CSV_FIELDS + tuple(names))
+        category_names = {category['id']: category['name'] for category in category_list}
+        for item in items:
+            writer.writerow([shop, item['category'], category_names[item['category']], item['id'], item['model'],
+                             item['name'], item['price'], item['price_rrc'], item['quantity']]
+                            + [item['parameters'][name] for name in names])
+
+    else:
+        dump = {'allow_unicode': True, 'sort_keys': False, 'Dumper': getattr(yaml, 'CSafeDumper', yaml.SafeDumper)}
+        file.write(yaml.dump({'shop': shop}, **dump))
+        file.write(yaml.dump({'categories': category_list}, **dump))
+        file.write('goods:\n')
+        for item in items:
+            file.write(yaml.dump([item], **dump))
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетического прайс-листа со структурой data/shop.yaml'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=1000, help='Количество товаров')
+        parser.add_argument('--parameters', type=int, default=4, help='Параметров у товара')
+        parser.add_argument('--categories', type=int, default=10, help='Количество категорий')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--format', dest='feed_format', choices=('yaml', 'jsonl', 'csv'), default='yaml')
+        parser.add_argument('--output', '-o', help='Файл прайс-листа, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        arguments = (options['goods'], options['parameters'], options['categories'])
+        keywords = {'seed': options['seed'], 'feed_format': options['feed_format']}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                write_pricelist(file, *arguments, **keywords)
+        else:
+            write_pricelist(sys.stdout, *arguments, **keywords)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.catalog import rebuild_catalog
+
+
+class Command(BaseCommand):
+    help = 'Полная пересборка каталога для чтения (CatalogEntry) из предложений магазинов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='ИД магазина, по умолчанию все магазины')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_catalog(options['shop'])
+        self.stdout.write(self.style.SUCCESS(f'Строк каталога: {count}'))
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from backend.models import Category, Contact, Order, OrderItem, Product, ProductInfo, Shop
+from shop.celery import app as celery_app
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Параллельное оформление заказов на один товар во временной базе: проверка, что остаток не уходит в минус'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=100, help='Покупателей, оформляющих заказ одновременно')
+        parser.add_argument('--threads', type=int, default=20, help='Параллельных запросов')
+        parser.add_argument('--stock', type=int, default=50, help='Остаток популярного товара')
+        parser.add_argument('--quantity', type=int, default=1, help='Количество товара в каждой корзине')
+        parser.add_argument('--output', '-o', default='checkout_stress.json', help='Файл JSON отчета')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Проверка рассчитана на временную базу SQLite')
+
+        # Файловая база вместо общей базы в памяти: у каждого потока свое соединение
+        test_name = os.path.join(tempfile.mkdtemp(), 'checkout.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = test_name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            product_info_id, orders = self.create_data(options)
+            # Письма о новых заказах уходят без брокера в локальный почтовый бэкенд
+            celery_app.conf.task_always_eager = True
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options['threads']) as executor:
+                    statuses = list(executor.map(self.checkout, orders))
+                elapsed = time.perf_counter() - started
+            stock = ProductInfo.objects.get(id=product_info_id).quantity
+            placed = Order.objects.filter(state='new').count()
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        sold = options['stock'] - stock
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'buyers': options['buyers'],
+            'threads': options['threads'],
+            'stock': options['stock'],
+            'quantity': options['quantity'],
+            'placed': placed,
+            'rejected': statuses.count(409),
+            'failed': len(statuses) - statuses.count(200) - statuses.count(409),
+            'remaining_stock': stock,
+            'seconds': round(elapsed, 3),
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f"Оформлено {placed}, отказано {report['rejected']}, ошибок {report['failed']}, "
+                          f"остаток {stock} за {report['seconds']} с")
+
+        expected = min(options['buyers'], options['stock'] // options['quantity'])
+        if stock < 0 or sold != placed * options['quantity'] or placed != expected or report['failed']:
+            raise CommandError(f'Остатки не сходятся: продано {sold}, оформлено {placed}, ожидалось {expected}')
+        self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
+
+    def create_data(self, options):
+        """
+        Один товар с остатком stock и корзины покупателей с этим товаром
+        """
+        shop = Shop.objects.create(name='Магазин')
+        product = Product.objects.create(name='Товар', category=Category.objects.create(name='Категория'))
+        product_info = ProductInfo.objects.create(product=product, shop=shop, model='model', price=100, price_rrc=120,
+                                                  quantity=options['stock'])
+        orders = []
+        for number in range(options['buyers']):
+            user = User.objects.create(email=f'buyer-{number}@example.com', type='buyer', is_active=True)
+            contact = Contact.objects.create(user=user, city='Москва', street='Тверская', phone='+70000000000')
+            order = Order.objects.create(user=user, state='basket')
+            OrderItem.objects.create(order=order, product_info=product_info, quantity=options['quantity'])
+            orders.append((Token.objects.create(user=user).key, order.id, contact.id))
+        return product_info.id, orders
+
+    def checkout(self, order):
+        token, order_id, contact_id = order
+        try:
+            return Client().post('/api/v1/order', {'id': str(order_id), 'contact': str(contact_id)},
+                                 HTTP_AUTHORIZATION=f'Token {token}').status_code
+        finally:
+            connections.close_all()
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_alter_productparameter_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceListState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, verbose_name='Ссылка')),
+                ('etag', models.CharField(blank=True, max_length=200, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=50, verbose_name='Last-Modified')),
+                ('digest', models.CharField(blank=True, max_length=64, verbose_name='SHA-256 содержимого')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('shop', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='price_list_state', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Состояние прайс-листа',
+                'verbose_name_plural': 'Состояния прайс-листов',
+            },
+        ),
+    ]
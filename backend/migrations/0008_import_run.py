@@ -0,0 +1,41 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_pricelist_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, verbose_name='Ссылка')),
+                ('state', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('finalizing', 'Завершается'), ('success', 'Завершен'), ('skipped', 'Пропущен'), ('failed', 'Ошибка')], default='queued', max_length=15, verbose_name='Статус')),
+                ('chunks', models.PositiveIntegerField(default=0, verbose_name='Частей')),
+                ('pending_chunks', models.IntegerField(default=0, verbose_name='Частей в работе')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('added', models.PositiveIntegerField(default=0, verbose_name='Добавлено')),
+                ('changed', models.PositiveIntegerField(default=0, verbose_name='Изменено')),
+                ('removed', models.PositiveIntegerField(default=0, verbose_name='Удалено')),
+                ('removed_ids', models.JSONField(blank=True, default=list, verbose_name='Внешние ИД к удалению')),
+                ('fetch', models.JSONField(blank=True, default=dict, verbose_name='Загрузка прайс-листа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершен')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_runs', to='backend.shop', verbose_name='Магазин')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_runs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запуск импорта',
+                'verbose_name_plural': 'Список запусков импорта',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_import_run'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importrun',
+            name='errors',
+            field=models.TextField(blank=True, verbose_name='Ошибки'),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='phases',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Время этапов, с'),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начат'),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=50, verbose_name='ИД задачи'),
+        ),
+        migrations.AddField(
+            model_name='importrun',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Обновлен'),
+        ),
+        migrations.AddIndex(
+            model_name='importrun',
+            index=models.Index(fields=['user', '-created_at'], name='import_run_user_created'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_catalog(apps, schema_editor):
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+
+    product_info_ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(product_info_ids), 1000):
+        batch = product_info_ids[start:start + 1000]
+        parameters = {}
+        for product_info_id, name, value in ProductParameter.objects.filter(product_info_id__in=batch) \
+                .order_by('id').values_list('product_info_id', 'parameter__name', 'value'):
+            parameters.setdefault(product_info_id, []).append({'parameter': name, 'value': value})
+        rows = ProductInfo.objects.filter(id__in=batch).values_list(
+            'id', 'shop_id', 'shop__state', 'product__category_id', 'product__name', 'product__category__name',
+            'model', 'quantity', 'price', 'price_rrc')
+        CatalogEntry.objects.bulk_create([
+            CatalogEntry(product_info_id=row[0], shop_id=row[1], shop_state=row[2], category_id=row[3],
+                         product_name=row[4], category_name=row[5], model=row[6], quantity=row[7],
+                         price=row[8], price_rrc=row[9], parameters=parameters.get(row[0], []))
+            for row in rows
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_product_info_cursor_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='backend.productinfo', verbose_name='Информация о продукте')),
+                ('shop_state', models.BooleanField(default=True, verbose_name='Статус получения заказов')),
+                ('product_name', models.CharField(max_length=50, verbose_name='Название товара')),
+                ('category_name', models.CharField(max_length=50, verbose_name='Название категории')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('parameters', models.JSONField(default=list, verbose_name='Параметры')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.category', verbose_name='Категория')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Строка каталога',
+                'verbose_name_plural': 'Каталог для чтения',
+                'indexes': [models.Index(fields=['shop_state', 'product_info'], name='catalog_state_id'), models.Index(fields=['shop', 'product_info'], name='catalog_shop_id'), models.Index(fields=['category', 'product_info'], name='catalog_category_id')],
+            },
+        ),
+        migrations.RunPython(build_catalog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+PARAMETER_VALUES = "(SELECT group_concat(json_extract(value, '$.value'), ' ') FROM json_each({}.parameters))"
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE backend_catalogsearch USING fts5("
+    "product_name, model, parameters, tokenize = 'unicode61 remove_diacritics 2')",
+
+    "CREATE TRIGGER backend_catalogsearch_insert AFTER INSERT ON backend_catalogentry BEGIN "
+    "INSERT INTO backend_catalogsearch (rowid, product_name, model, parameters) "
+    f"VALUES (new.product_info_id, new.product_name, new.model, {PARAMETER_VALUES.format('new')}); "
+    "END",
+
+    "CREATE TRIGGER backend_catalogsearch_delete AFTER DELETE ON backend_catalogentry BEGIN "
+    "DELETE FROM backend_catalogsearch WHERE rowid = old.product_info_id; "
+    "END",
+
+    "CREATE TRIGGER backend_catalogsearch_update AFTER UPDATE OF product_name, model, parameters "
+    "ON backend_catalogentry BEGIN "
+    "DELETE FROM backend_catalogsearch WHERE rowid = old.product_info_id; "
+    "INSERT INTO backend_catalogsearch (rowid, product_name, model, parameters) "
+    f"VALUES (new.product_info_id, new.product_name, new.model, {PARAMETER_VALUES.format('new')}); "
+    "END",
+
+    "INSERT INTO backend_catalogsearch (rowid, product_name, model, parameters) "
+    "SELECT product_info_id, product_name, model, "
+    f"{PARAMETER_VALUES.format('backend_catalogentry')} FROM backend_catalogentry",
+)
+
+DROP_SQL = (
+    "DROP TRIGGER IF EXISTS backend_catalogsearch_update",
+    "DROP TRIGGER IF EXISTS backend_catalogsearch_delete",
+    "DROP TRIGGER IF EXISTS backend_catalogsearch_insert",
+    "DROP TABLE IF EXISTS backend_catalogsearch",
+)
+
+
+def run_sqlite(statements):
+    """
+    Полнотекстовый индекс FTS5 есть только в SQLite, на других базах поиск работает без него
+    """
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_catalog_entry'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
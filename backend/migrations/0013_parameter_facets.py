@@ -0,0 +1,89 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:33
+
+import math
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_values_and_facets(apps, schema_editor):
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    ParameterFacet = apps.get_model('backend', 'ParameterFacet')
+
+    changed = []
+    for product_parameter in ProductParameter.objects.only('id', 'value').iterator():
+        try:
+            number = float(product_parameter.value.replace(',', '.'))
+        except ValueError:
+            continue
+        if math.isfinite(number):
+            product_parameter.value_num = number
+            changed.append(product_parameter)
+    ProductParameter.objects.bulk_update(changed, ['value_num'], batch_size=1000)
+
+    rows = ProductParameter.objects.values_list('product_info__shop_id', 'product_info__product__category_id',
+                                                'parameter_id', 'value').annotate(total=Count('id')).order_by()
+    ParameterFacet.objects.bulk_create([
+        ParameterFacet(shop_id=shop_id, category_id=category_id, parameter_id=parameter_id, value=value, count=total)
+        for shop_id, category_id, parameter_id, value, total in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_catalog_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(verbose_name='Количество предложений')),
+            ],
+            options={
+                'verbose_name': 'Значение параметра в каталоге',
+                'verbose_name_plural': 'Значения параметров в каталоге',
+            },
+        ),
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_num',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value_num', 'product_info'], name='product_parameter_num'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_facets', to='backend.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_facets', to='backend.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddIndex(
+            model_name='parameterfacet',
+            index=models.Index(fields=['category', 'parameter', 'value'], name='parameter_facet_category'),
+        ),
+        migrations.AddConstraint(
+            model_name='parameterfacet',
+            constraint=models.UniqueConstraint(fields=('shop', 'category', 'parameter', 'value'), name='unique_parameter_facet'),
+        ),
+        migrations.RunPython(fill_values_and_facets, migrations.RunPython.noop),
+    ]
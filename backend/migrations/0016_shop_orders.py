@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-18 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def fill_shop_orders(apps, schema_editor):
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ShopOrder = apps.get_model('backend', 'ShopOrder')
+
+    rows = OrderItem.objects.exclude(order__state='basket') \
+        .values_list('product_info__shop_id', 'order_id', 'order__state', 'order__dt') \
+        .annotate(total=Sum(F('quantity') * F('product_info__price')), count=Count('id')).order_by()
+    ShopOrder.objects.bulk_create([
+        ShopOrder(shop_id=shop_id, order_id=order_id, state=state, dt=dt, total_sum=total, items_count=count)
+        for shop_id, order_id, state, dt, total, count in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('basket', 'Статус корзины'), ('new', 'Новый'), ('confirmed', 'Подтвержден'), ('assembled', 'Собран'), ('sent', 'Отправлен'), ('delivered', 'Доставлен'), ('canceled', 'Отменен')], max_length=15, verbose_name='Статус')),
+                ('dt', models.DateTimeField(verbose_name='Дата заказа')),
+                ('total_sum', models.PositiveBigIntegerField(default=0, verbose_name='Сумма позиций магазина')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='Количество позиций магазина')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.order', verbose_name='Заказ')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Заказ магазина',
+                'verbose_name_plural': 'Заказы магазинов',
+                'indexes': [models.Index(fields=['shop', 'state', 'dt'], name='shop_order_state_dt')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoporder',
+            constraint=models.UniqueConstraint(fields=('shop', 'order'), name='unique_shop_order'),
+        ),
+        migrations.RunPython(fill_shop_orders, migrations.RunPython.noop),
+    ]
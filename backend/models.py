@@ -12,6 +12,15 @@ STATE_CHOICES = (
     ('delivered', 'Доставлен'),
     ('canceled', 'Отменен'),
 )
+IMPORT_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('finalizing', 'Завершается'),
+    ('success', 'Завершен'),
+    ('skipped', 'Пропущен'),
+    ('failed', 'Ошибка'),
+)
+
 
 class Shop(models.Model):
     """
@@ -33,6 +42,65 @@ class Shop(models.Model):
         return self.name
 
 
+class PriceListState(models.Model):
+    """
+    Состояние последней загрузки прайс-листа магазина
+    """
+    shop = models.OneToOneField(Shop, verbose_name='Магазин', related_name='price_list_state',
+                                on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка', max_length=500)
+    etag = models.CharField(verbose_name='ETag', max_length=200, blank=True)
+    last_modified = models.CharField(verbose_name='Last-Modified', max_length=50, blank=True)
+    digest = models.CharField(verbose_name='SHA-256 содержимого', max_length=64, blank=True)
+    size = models.PositiveBigIntegerField(verbose_name='Размер, байт', default=0)
+    updated_at = models.DateTimeField(verbose_name='Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Состояние прайс-листа'
+        verbose_name_plural = "Состояния прайс-листов"
+
+    def __str__(self):
+        return f'{self.shop} {self.url}'
+
+
+class ImportRun(models.Model):
+    """
+    Запуск импорта прайс-листа
+    """
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='import_runs',
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='import_runs', blank=True, null=True,
+                             on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка', max_length=500)
+    task_id = models.CharField(verbose_name='ИД задачи', max_length=50, blank=True)
+    state = models.CharField(verbose_name='Статус', choices=IMPORT_STATE_CHOICES, max_length=15, default='queued')
+    chunks = models.PositiveIntegerField(verbose_name='Частей', default=0)
+    pending_chunks = models.IntegerField(verbose_name='Частей в работе', default=0)
+    rows = models.PositiveIntegerField(verbose_name='Обработано строк', default=0)
+    added = models.PositiveIntegerField(verbose_name='Добавлено', default=0)
+    changed = models.PositiveIntegerField(verbose_name='Изменено', default=0)
+    removed = models.PositiveIntegerField(verbose_name='Удалено', default=0)
+    removed_ids = models.JSONField(verbose_name='Внешние ИД к удалению', default=list, blank=True)
+    fetch = models.JSONField(verbose_name='Загрузка прайс-листа', default=dict, blank=True)
+    phases = models.JSONField(verbose_name='Время этапов, с', default=dict, blank=True)
+    errors = models.TextField(verbose_name='Ошибки', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создан', auto_now_add=True)
+    started_at = models.DateTimeField(verbose_name='Начат', blank=True, null=True)
+    updated_at = models.DateTimeField(verbose_name='Обновлен', auto_now=True)
+    finished_at = models.DateTimeField(verbose_name='Завершен', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Запуск импорта'
+        verbose_name_plural = "Список запусков импорта"
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='import_run_user_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.url} {self.state}'
+
+
 class Category(models.Model):
     """
     Категория
@@ -86,6 +154,10 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
         ]
+        indexes = [
+            models.Index(fields=['shop', 'id'], name='product_info_shop_id'),
+            models.Index(fields=['shop', 'price'], name='product_info_shop_price'),
+        ]
 
 
 class Parameter(models.Model):
@@ -114,6 +186,7 @@ class ProductParameter(models.Model):
     parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='product_parameters', blank=True,
                                   on_delete=models.CASCADE)
     value = models.CharField(verbose_name='Значение', max_length=100)
+    value_num = models.FloatField(verbose_name='Числовое значение', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -121,6 +194,72 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value'),
+            models.Index(fields=['parameter', 'value_num', 'product_info'], name='product_parameter_num'),
+        ]
+
+
+class ParameterFacet(models.Model):
+    """
+    Количество предложений магазина в категории со значением параметра: пересчитывается после импорта,
+    при изменении параметров, предложений и товаров вне импорта правится построчно
+    """
+    objects = models.manager.Manager()
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='parameter_facets', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='parameter_facets',
+                                 on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facets', on_delete=models.CASCADE)
+    value = models.CharField(verbose_name='Значение', max_length=100)
+    count = models.PositiveIntegerField(verbose_name='Количество предложений')
+
+    class Meta:
+        verbose_name = 'Значение параметра в каталоге'
+        verbose_name_plural = "Значения параметров в каталоге"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'category', 'parameter', 'value'], name='unique_parameter_facet'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'parameter', 'value'], name='parameter_facet_category'),
+        ]
+
+
+class CatalogEntry(models.Model):
+    """
+    Строка каталога для чтения: предложение магазина с названиями товара, категории
+    и параметрами, собранными заранее из ProductInfo, Product, Category, Shop и ProductParameter
+    """
+    objects = models.manager.Manager()
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Информация о продукте', primary_key=True,
+                                        related_name='catalog_entry', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='catalog_entries', on_delete=models.CASCADE)
+    shop_state = models.BooleanField(verbose_name='Статус получения заказов', default=True)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='catalog_entries',
+                                 on_delete=models.CASCADE)
+    product_name = models.CharField(verbose_name='Название товара', max_length=50)
+    category_name = models.CharField(verbose_name='Название категории', max_length=50)
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=list)
+
+    class Meta:
+        verbose_name = 'Строка каталога'
+        verbose_name_plural = "Каталог для чтения"
+        indexes = [
+            models.Index(fields=['shop_state', 'product_info'], name='catalog_state_id'),
+            models.Index(fields=['shop', 'product_info'], name='catalog_shop_id'),
+            models.Index(fields=['category', 'product_info'], name='catalog_category_id'),
+            models.Index(fields=['price', 'product_info'], condition=models.Q(shop_state=True),
+                         name='catalog_active_price'),
+            models.Index(fields=['shop', 'price', 'product_info'], name='catalog_shop_price'),
+            models.Index(fields=['category', 'price', 'product_info'], name='catalog_category_price'),
+            models.Index(fields=['category', 'quantity', 'product_info'], name='catalog_category_quantity'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_name} ({self.shop_id})'
 
 
 class Contact(models.Model):
@@ -154,6 +293,8 @@ class Order(models.Model):
     status = models.CharField(verbose_name='Статус заказа', max_length=20)
     state = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15, default='default_value')
     contact = models.ForeignKey(Contact, verbose_name='Контакт', blank=True, null=True, on_delete=models.CASCADE)
+    total_sum = models.PositiveBigIntegerField(verbose_name='Сумма заказа', default=0)
+    items_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0)
 
     class Meta:
         verbose_name = 'Заказ'
@@ -178,3 +319,25 @@ class OrderItem(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order', 'product_info'], name='unique_order_item'),
         ]
+
+
+class ShopOrder(models.Model):
+    """
+    Оформленный заказ с точки зрения магазина: статус, дата и сумма позиций магазина
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='shop_orders', on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='shop_orders', on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15)
+    dt = models.DateTimeField(verbose_name='Дата заказа')
+    total_sum = models.PositiveBigIntegerField(verbose_name='Сумма позиций магазина', default=0)
+    items_count = models.PositiveIntegerField(verbose_name='Количество позиций магазина', default=0)
+
+    class Meta:
+        verbose_name = 'Заказ магазина'
+        verbose_name_plural = "Заказы магазинов"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'order'], name='unique_shop_order'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'state', 'dt'], name='shop_order_state_dt'),
+        ]
@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from backend.catalog import refresh_catalog_quantities
+from backend.catalog_cache import bump_shop
+from backend.models import Order, OrderItem, ProductInfo, ShopOrder
+
+pending_orders = ContextVar('pending_orders', default=None)
+
+
+def refresh_order_totals(order_ids):
+    """
+    Пересчет сохраненных суммы и количества позиций заказов одним UPDATE.
+    Строки заказов блокируются, чтобы параллельные изменения корзины не потеряли позиции
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    with transaction.atomic():
+        list(Order.objects.select_for_update().filter(id__in=order_ids).order_by('pk').values_list('pk', flat=True))
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        Order.objects.filter(id__in=order_ids).update(
+            total_sum=Coalesce(Subquery(items.annotate(total=Sum(F('quantity') * F('product_info__price')))
+                                        .values('total')), 0),
+            items_count=Coalesce(Subquery(items.annotate(total=Count('id')).values('total')), 0),
+        )
+        refresh_shop_orders(order_ids)
+
+
+def refresh_shop_orders(order_ids):
+    """
+    Пересборка строк ShopOrder оформленных заказов: по строке на каждый магазин из позиций заказа
+    """
+    ShopOrder.objects.filter(order_id__in=order_ids).delete()
+    rows = OrderItem.objects.filter(order_id__in=order_ids).exclude(order__state='basket') \
+        .values_list('product_info__shop_id', 'order_id', 'order__state', 'order__dt') \
+        .annotate(total=Sum(F('quantity') * F('product_info__price')), count=Count('id')).order_by()
+    ShopOrder.objects.bulk_create([
+        ShopOrder(shop_id=shop_id, order_id=order_id, state=state, dt=dt, total_sum=total, items_count=count)
+        for shop_id, order_id, state, dt, total, count in rows
+    ])
+
+
+def refresh_basket_totals(product_info_ids):
+    """
+    Пересчет корзин с предложениями, у которых могла измениться цена.
+    Оформленные заказы сохраняют сумму на момент оформления
+    """
+    refresh_order_totals(Order.objects.filter(state='basket', order_items__product_info_id__in=product_info_ids)
+                         .values_list('id', flat=True).distinct())
+
+
+def order_items_changed(order_ids):
+    """
+    Пересчет итогов заказов после изменения позиций: сразу или в конце блока deferred_order_totals
+    """
+    pending = pending_orders.get()
+    if pending is None:
+        refresh_order_totals(order_ids)
+    else:
+        pending.update(order_ids)
+
+
+@contextmanager
+def deferred_order_totals():
+    """
+    Транзакция, в конце которой итоги заказов с измененными позициями пересчитываются один раз,
+    а не после каждой позиции
+    """
+    pending = set()
+    token = pending_orders.set(pending)
+    try:
+        with transaction.atomic():
+            yield pending
+            refresh_order_totals(pending)
+    finally:
+        pending_orders.reset(token)
+
+
+def reserve_stock(quantities):
+    """
+    Списание остатков {ИД предложения: количество} одним условным UPDATE:
+    quantity = quantity - n для всех строк, где quantity >= n.
+
+    Строки блокируются только самим UPDATE, условие проверяется заново после ожидания блокировки,
+    поэтому параллельные оформления не уводят остаток в минус. Возвращает число списанных строк.
+    """
+    needed = Case(*(When(id=product_info_id, then=Value(quantity))
+                    for product_info_id, quantity in quantities.items()))
+    return ProductInfo.objects.filter(id__in=quantities, quantity__gte=needed) \
+        .update(quantity=F('quantity') - needed)
+
+
+def place_order(user_id, order_id, contact_id):
+    """
+    Оформление корзины: статус new, контакт и резерв остатков всех позиций в одной транзакции.
+
+    Возвращает None, если корзина не найдена, иначе ошибки по ИД позиций.
+    Если хоть одной позиции не хватает, транзакция откатывается и остатки не меняются.
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(id=order_id, user_id=user_id, state='basket') \
+                .update(state='new', contact_id=contact_id):
+            return None
+
+        items = list(OrderItem.objects.filter(order_id=order_id).values_list('id', 'product_info_id', 'quantity'))
+        if not items:
+            transaction.set_rollback(True)
+            return {'basket': 'Корзина пуста'}
+
+        quantities = {product_info_id: quantity for _, product_info_id, quantity in items}
+        if reserve_stock(quantities) < len(quantities):
+            transaction.set_rollback(True)
+        else:
+            refresh_catalog_quantities(quantities)
+            refresh_shop_orders([order_id])
+            for shop_id in ProductInfo.objects.filter(id__in=quantities).values_list('shop_id', flat=True).distinct():
+                bump_shop(shop_id)
+            return {}
+
+    available = dict(ProductInfo.objects.filter(id__in=quantities).values_list('id', 'quantity'))
+    errors = {
+        item_id: f'Недостаточно товара, в наличии {available.get(product_info_id, 0)}'
+        for item_id, product_info_id, quantity in items
+        if available.get(product_info_id, 0) < quantity
+    }
+    return errors or {'basket': 'Остатки изменились во время оформления, повторите попытку'}
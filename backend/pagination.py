@@ -0,0 +1,182 @@
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def keyset_after(ordering, position):
+    """
+    Условие "строка после position" для сортировки ordering по всем ее полям:
+    (a, b) > (x, y) записывается как a >= x AND (a > x OR b > y), чтобы по первому полю
+    был диапазон индекса, а равные значения различались следующими полями
+    """
+    field, *rest = ordering
+    name = field.lstrip('-')
+    lookup = 'lt' if field.startswith('-') else 'gt'
+    after = Q(**{f'{name}__{lookup}': position[0]})
+    if not rest:
+        return after
+    return Q(**{f'{name}__{lookup}e': position[0]}) & (after | keyset_after(rest, position[1:]))
+
+
+class ProductInfoCursorPagination(CursorPagination):
+    """
+    Постраничный вывод предложений по курсору.
+
+    Курсор хранит значения всех полей сортировки последней строки страницы (например, цену и ИД),
+    следующая страница выбирается условием по ним вместо OFFSET, поэтому стоимость запроса
+    не растет с номером страницы и при совпадающих ценах строки не повторяются.
+    Строка, у которой поле сортировки изменилось между запросами (остаток при оформлении заказа),
+    может быть пропущена или показана повторно, но обход страниц всегда заканчивается.
+    """
+    ordering = 'pk'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering_options = {
+        'price': ('price', 'pk'),
+        '-price': ('-price', '-pk'),
+        'quantity': ('quantity', 'pk'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Сортировка из параметра ordering, по умолчанию по ИД
+        """
+        return self.ordering_options.get(request.query_params.get('ordering'), (self.ordering,))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset для асинхронных представлений: строки страницы читаются асинхронным ORM
+        """
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page([row async for row in page_queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Запрос страницы по курсору из строки запроса: сортировка, условие после позиции курсора
+        и на одну строку больше размера страницы, чтобы узнать о следующей
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor.reverse
+        self.position = None if self.cursor is None else self.cursor.position
+
+        ordering = reverse_ordering(self.ordering) if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(keyset_after(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """
+        Страница из строк get_page_queryset и позиции курсоров соседних страниц
+        """
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.next_position = self.get_position(self.page[-1]) if self.page else self.position
+        self.previous_position = self.get_position(self.page[0]) if self.page else self.position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_position(self, instance):
+        if isinstance(instance, dict):
+            return tuple(instance[field.lstrip('-')] for field in self.ordering)
+        return tuple(getattr(instance, field.lstrip('-')) for field in self.ordering)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def decode_cursor(self, request):
+        """
+        Курсор с позицией - целыми значениями полей сортировки через запятую
+        """
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            position = tuple(int(value) for value in cursor.position.split(','))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        if cursor.position is not None:
+            cursor = cursor._replace(position=','.join(str(value) for value in cursor.position))
+        return super().encode_cursor(cursor)
+
+
+class ShopOrderCursorPagination(CursorPagination):
+    """
+    Постраничный вывод заказов магазина по курсору, новые первыми:
+    с фильтром по статусу страница читается диапазоном индекса (магазин, статус, дата)
+    """
+    ordering = '-dt'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы, как у PageNumberPagination,
+    с количеством и строками страницы из асинхронного ORM
+    """
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [row async for row in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Постраничный вывод результатов поиска в порядке релевантности
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,118 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_PIN_KEY = 'db:primary:{}'
+
+replica_reads = ContextVar('replica_reads', default=False)
+request_writes = ContextVar('request_writes', default=None)
+
+
+def pin_primary(user):
+    """
+    Чтение пользователя из основной базы на REPLICA_STICKY_SECONDS после записи,
+    пока реплики не получили изменения
+    """
+    if settings.REPLICA_DATABASES and user is not None and user.is_authenticated:
+        cache.set(PRIMARY_PIN_KEY.format(user.id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and bool(cache.get(PRIMARY_PIN_KEY.format(user.id)))
+
+
+@contextmanager
+def primary_reads():
+    """
+    Чтение из основной базы внутри блока, в том числе в представлениях с ReplicaReadMixin
+    """
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтение из реплик REPLICA_DATABASES внутри представлений с ReplicaReadMixin,
+    остальное чтение и вся запись - в основную базу default
+    """
+    def db_for_read(self, model, **hints):
+        if replica_reads.get() and settings.REPLICA_DATABASES:
+            return random.choice(settings.REPLICA_DATABASES)
+        return None
+
+    def db_for_write(self, model, **hints):
+        writes = request_writes.get()
+        if writes is not None:
+            writes['count'] += 1
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Отмечает пользователя, запрос которого писал в базу, чтобы следующие чтения шли в основную базу.
+
+    Работает и в синхронном, и в асинхронном режиме, чтобы под ASGI асинхронные представления
+    не переводились в поток
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        writes = {'count': 0}
+        token = request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_writes.reset(token)
+        if writes['count']:
+            pin_primary(getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        writes = {'count': 0}
+        token = request_writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_writes.reset(token)
+        if writes['count']:
+            await sync_to_async(pin_primary)(getattr(request, 'user', None))
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    Безопасные методы (GET, HEAD, OPTIONS) представления читают из реплик,
+    если пользователь недавно не писал в базу
+    """
+    def dispatch(self, request, *args, **kwargs):
+        self.replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.replica_token is not None:
+                replica_reads.reset(self.replica_token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if settings.REPLICA_DATABASES and request.method in SAFE_METHODS and not is_pinned(request.user):
+            self.replica_token = replica_reads.set(True)
@@ -0,0 +1,79 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from backend.models import CatalogEntry
+
+SEARCH_TABLE = 'backend_catalogsearch'
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def match_expression(terms):
+    """
+    Запрос FTS5 из слов пользовательской строки: все слова обязательны, каждое ищется как префикс
+    """
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+class SearchResults:
+    """
+    Результаты поиска по каталогу, упорядоченные по релевантности (bm25).
+
+    Поддерживает count() и срезы, поэтому постранично выводится стандартной пагинацией:
+    на страницу выполняется один запрос к индексу FTS5 и один запрос строк каталога.
+    На базах без FTS5 ищется по вхождению в название и модель.
+    """
+    def __init__(self, query, shop_id=None, category_id=None):
+        self.terms = search_terms(query)
+        self.filters = {'shop_state': True}
+        if shop_id:
+            self.filters['shop_id'] = shop_id
+        if category_id:
+            self.filters['category_id'] = category_id
+
+    def use_fts(self):
+        return connection.vendor == 'sqlite'
+
+    def where(self):
+        conditions = [f'{SEARCH_TABLE} MATCH %s']
+        params = [match_expression(self.terms)]
+        for field, value in self.filters.items():
+            conditions.append(f'entry.{field} = %s')
+            params.append(value)
+        return ' AND '.join(conditions), params
+
+    def fallback(self):
+        query = Q()
+        for term in self.terms:
+            query &= Q(product_name__icontains=term) | Q(model__icontains=term)
+        return CatalogEntry.objects.filter(query, **self.filters).order_by('pk')
+
+    def count(self):
+        if not self.use_fts():
+            return self.fallback().count()
+        where, params = self.where()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE} '
+                           f'JOIN backend_catalogentry entry ON entry.product_info_id = {SEARCH_TABLE}.rowid '
+                           f'WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, page):
+        if not self.use_fts():
+            return list(self.fallback()[page])
+        where, params = self.where()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {SEARCH_TABLE}.rowid FROM {SEARCH_TABLE} '
+                           f'JOIN backend_catalogentry entry ON entry.product_info_id = {SEARCH_TABLE}.rowid '
+                           f'WHERE {where} ORDER BY {SEARCH_TABLE}.rank LIMIT %s OFFSET %s',
+                           params + [page.stop - page.start, page.start])
+            ids = [row[0] for row in cursor.fetchall()]
+        entries = CatalogEntry.objects.in_bulk(ids)
+        return [entries[product_info_id] for product_info_id in ids if product_info_id in entries]
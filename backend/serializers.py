@@ -1,6 +1,8 @@
 from rest_framework import serializers
 
-from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact
+from backend import lookups
+from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, ImportRun, \
+    CatalogEntry
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -36,8 +38,20 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class ReferenceNameField(serializers.ReadOnlyField):
+    """
+    Название записи справочника по ИД из кеша справочников
+    """
+    def __init__(self, reference_cache, **kwargs):
+        self.reference_cache = reference_cache
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.reference_cache.name(value)
+
+
 class ProductSerializer(serializers.ModelSerializer):
-    category = serializers.StringRelatedField()
+    category = ReferenceNameField(lookups.categories, source='category_id')
 
     class Meta:
         model = Product
@@ -45,7 +59,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
 
 class ProductParameterSerializer(serializers.ModelSerializer):
-    parameter = serializers.StringRelatedField()
+    parameter = ReferenceNameField(lookups.parameters, source='parameter_id')
 
     class Meta:
         model = ProductParameter
@@ -62,6 +76,23 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class CatalogEntrySerializer(serializers.ModelSerializer):
+    """
+    Строка каталога в формате ProductInfoSerializer
+    """
+    id = serializers.ReadOnlyField(source='product_info_id')
+    product = serializers.SerializerMethodField()
+    shop = serializers.ReadOnlyField(source='shop_id')
+    product_parameters = serializers.ReadOnlyField(source='parameters')
+
+    class Meta:
+        model = CatalogEntry
+        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters',)
+
+    def get_product(self, obj):
+        return {'name': obj.product_name, 'category': obj.category_name}
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
@@ -77,7 +108,7 @@ class OrderItemCreateSerializer(OrderItemSerializer):
 
 
 class OrderSerializer(serializers.ModelSerializer):
-    ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
+    ordered_items = OrderItemCreateSerializer(source='order_items', read_only=True, many=True)
 
     total_sum = serializers.IntegerField()
     contact = ContactSerializer(read_only=True)
@@ -85,4 +116,12 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact',)
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+
+class ImportRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportRun
+        fields = ('id', 'url', 'shop', 'state', 'chunks', 'pending_chunks', 'rows', 'added', 'changed', 'removed',
+                  'phases', 'fetch', 'errors', 'created_at', 'started_at', 'updated_at', 'finished_at',)
+        read_only_fields = fields
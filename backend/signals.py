@@ -1,8 +1,15 @@
 from shop.tasks import send_email
 from django.dispatch import receiver, Signal
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
 from django_rest_passwordreset.signals import reset_password_token_created
 from users.models import ConfirmEmailToken, User
+from backend.catalog import refresh_catalog
+from backend.catalog_cache import bump_reference, bump_shop
+from backend.facets import adjust_facets, parameter_facet_keys, parse_number
+from backend.lookups import REFERENCE_CACHES
+from backend.models import CatalogEntry, Category, Order, OrderItem, Parameter, Product, ProductInfo, ProductParameter, \
+    Shop, ShopOrder
+from backend.orders import order_items_changed, refresh_basket_totals
 
 new_order = Signal()
 
@@ -16,3 +23,158 @@ def new_order_signal(sender, user_id, **kwargs):
         send_email.delay("Обновление статуса заказа", "Заказ сформирован", [user.email])
     except User.DoesNotExist:
         print(f"User with id {user_id} does not exist.")
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Parameter)
+@receiver(post_delete, sender=Parameter)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_reference_cache(sender, instance, **kwargs):
+    """
+    Сбрасываем запись кеша справочников и версию кешированных ответов каталога при изменении или удалении
+    """
+    REFERENCE_CACHES[sender].invalidate(instance)
+    bump_reference()
+
+
+@receiver(post_migrate)
+def clear_reference_cache(sender, **kwargs):
+    """
+    Очищаем кеш справочников после миграций и очистки базы (flush)
+    """
+    for cache in REFERENCE_CACHES.values():
+        cache.clear()
+
+
+@receiver(post_save, sender=ProductInfo)
+def refresh_catalog_offer(sender, instance, **kwargs):
+    """
+    Пересобираем строку каталога при изменении предложения
+    """
+    refresh_catalog([instance.id])
+    bump_shop(instance.shop_id)
+
+
+@receiver(post_save, sender=ProductInfo)
+def refresh_offer_baskets(sender, instance, created, **kwargs):
+    """
+    Пересчитываем суммы корзин с предложением после изменения цены
+    """
+    if not created:
+        refresh_basket_totals([instance.id])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_totals_item(sender, instance, **kwargs):
+    """
+    Пересчитываем сохраненные сумму и количество позиций заказа при изменении позиции
+    """
+    order_items_changed([instance.order_id])
+
+
+@receiver(post_save, sender=Order)
+def refresh_shop_orders_state(sender, instance, created, **kwargs):
+    """
+    Обновляем статус заказов магазинов при изменении статуса заказа.
+    Суммы магазинов считаются при оформлении и по текущим ценам не пересчитываются
+    """
+    if not created:
+        ShopOrder.objects.filter(order_id=instance.id).update(state=instance.state)
+
+
+@receiver(pre_save, sender=ProductParameter)
+def set_parameter_number(sender, instance, **kwargs):
+    instance.value_num = parse_number(instance.value)
+    instance._facet_keys = [] if instance._state.adding else \
+        parameter_facet_keys(ProductParameter.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ProductParameter)
+def refresh_catalog_offer_parameters(sender, instance, **kwargs):
+    """
+    Пересобираем строку каталога и правим количества по прежнему и новому значению параметра
+    """
+    refresh_catalog([instance.product_info_id])
+    adjust_facets(instance._facet_keys, parameter_facet_keys(ProductParameter.objects.filter(pk=instance.pk)))
+    for shop_id in {instance.product_info.shop_id}.union(key[0] for key in instance._facet_keys):
+        bump_shop(shop_id)
+
+
+@receiver(pre_delete, sender=ProductParameter)
+def remove_parameter_facet(sender, instance, **kwargs):
+    """
+    Уменьшаем количество по значению удаляемого параметра, в том числе при удалении предложения,
+    товара или магазина
+    """
+    removed = parameter_facet_keys(ProductParameter.objects.filter(pk=instance.pk))
+    adjust_facets(removed=removed)
+    for shop_id in {key[0] for key in removed}:
+        bump_shop(shop_id)
+
+
+@receiver(pre_save, sender=ProductInfo)
+def remember_offer_place(sender, instance, **kwargs):
+    instance._place = None if instance._state.adding else \
+        ProductInfo.objects.filter(pk=instance.pk).values_list('shop_id', 'product__category_id').first()
+
+
+@receiver(post_save, sender=ProductInfo)
+def move_offer_facets(sender, instance, created, **kwargs):
+    """
+    Переносим количества по значениям параметров, если предложение перешло в другой магазин или товар
+    другой категории
+    """
+    if instance._place is not None and instance._place != (instance.shop_id, instance.product.category_id):
+        shop_id, category_id = instance._place
+        added = parameter_facet_keys(ProductParameter.objects.filter(product_info_id=instance.id))
+        adjust_facets([(shop_id, category_id, *key[2:]) for key in added], added)
+        bump_shop(shop_id)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, **kwargs):
+    instance._category_id = None if instance._state.adding else \
+        Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def move_product_facets(sender, instance, created, **kwargs):
+    """
+    Переносим количества по значениям параметров предложений товара при смене его категории
+    """
+    if instance._category_id is not None and instance._category_id != instance.category_id:
+        added = parameter_facet_keys(ProductParameter.objects.filter(product_info__product_id=instance.id))
+        adjust_facets([(key[0], instance._category_id, *key[2:]) for key in added], added)
+        for shop_id in {key[0] for key in added}:
+            bump_shop(shop_id)
+
+
+@receiver(post_save, sender=Parameter)
+def refresh_catalog_parameter(sender, instance, created, **kwargs):
+    if not created:
+        refresh_catalog(ProductParameter.objects.filter(parameter_id=instance.id)
+                        .values_list('product_info_id', flat=True))
+
+
+@receiver(post_save, sender=Product)
+def refresh_catalog_product(sender, instance, created, **kwargs):
+    if not created:
+        CatalogEntry.objects.filter(product_info__product_id=instance.id).update(
+            product_name=instance.name, category_id=instance.category_id,
+            category_name=instance.category.name)
+
+
+@receiver(post_save, sender=Category)
+def refresh_catalog_category(sender, instance, created, **kwargs):
+    if not created:
+        CatalogEntry.objects.filter(category_id=instance.id).update(category_name=instance.name)
+
+
+@receiver(post_save, sender=Shop)
+def refresh_catalog_shop(sender, instance, created, **kwargs):
+    if not created:
+        CatalogEntry.objects.filter(shop_id=instance.id).update(shop_state=instance.state)
+    bump_shop(instance.id)
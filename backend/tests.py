@@ -1,3 +1,1420 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from threading import Thread
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from yaml import Loader, load as load_yaml
+
+from backend import lookups
+from backend.catalog_cache import bump_shop, version_timeout
+from backend.checks import check_shared_cache
+from backend.export import CSV_COLUMNS, EXPORT_FORMATS, export_entries, iter_export
+from backend.facets import rebuild_facets
+from backend.fast_serializers import PRODUCT_INFO_FIELDS, serialize_orders, serialize_product_infos
+from backend.feeds import CSV_FIELDS, FeedError, iter_feed_records
+from backend.importer import PriceListImporter
+from backend.management.commands.generate_pricelist import generate_goods
+from backend.models import CatalogEntry, Category, Contact, ImportRun, Order, OrderItem, Parameter, ParameterFacet, \
+    PriceListState, Product, ProductInfo, ProductParameter, Shop
+from backend.serializers import OrderSerializer, ProductInfoSerializer
+from shop.celery import app as celery_app
+from shop.tasks import do_import
+from users.models import User
+
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class SharedCacheCheckTests(TestCase):
+    """
+    Проверка общего кеша для web и Celery
+    """
+    @override_settings(CACHES=LOCAL_CACHES, DEBUG=False)
+    def test_process_local_cache_is_error(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['backend.E001', 'backend.E002'])
+
+    @override_settings(CACHES=LOCAL_CACHES, DEBUG=True, REPLICA_DATABASES=['replica1'])
+    def test_process_local_cache_is_warning_in_debug(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)],
+                         ['backend.W001', 'backend.W002', 'backend.W003'])
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_local_versions_expire(self):
+        self.assertEqual(version_timeout(), settings.CATALOG_LOCAL_VERSION_TIMEOUT)
+
+    def test_shared_cache(self):
+        self.assertEqual(check_shared_cache(None), [])
+        self.assertIsNone(version_timeout())
+
+
+class ReferenceCacheTests(TestCase):
+    """
+    Кеш справочников и записи, удаленные в другом процессе
+    """
+    def setUp(self):
+        for cache in lookups.REFERENCE_CACHES.values():
+            cache.clear()
+        self.user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        with open(os.path.join(settings.BASE_DIR, 'data', 'shop.yaml'), encoding='utf-8') as file:
+            self.data = load_yaml(file, Loader=Loader)
+
+    def test_refresh_evicts_deleted(self):
+        good = self.data['goods'][0]
+        lookups.products._store([(10 ** 9, good['name'], good['category'])])
+        lookups.parameters._store([(10 ** 9, 'Цвет')])
+
+        self.assertEqual(lookups.refresh_reference_caches(), {'parameter': 1, 'category': 0, 'product': 1})
+        self.assertEqual(lookups.products.ids({(good['name'], good['category'])}), {})
+
+    def test_import_after_delete_in_other_process(self):
+        good = self.data['goods'][0]
+        lookups.products._store([(10 ** 9, good['name'], good['category'])])
+
+        PriceListImporter(self.user.id).run(iter_feed_records(self.data))
+        self.assertFalse(ProductInfo.objects.exclude(product_id__in=Product.objects.values('id')).exists())
+
+    @override_settings(REFERENCE_CACHE_SIZE=3)
+    def test_lru_eviction(self):
+        names = ['Цвет', 'Вес', 'Объем', 'Длина']
+        ids = {name: Parameter.objects.create(name=name).id for name in names}
+        with self.captureOnCommitCallbacks(execute=True):
+            lookups.parameters.ids(names[:3])
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.parameters.ids(['Цвет']), {'Цвет': ids['Цвет']})
+        with self.captureOnCommitCallbacks(execute=True):
+            lookups.parameters.ids(['Длина'])
+
+        self.assertEqual(lookups.parameters.stats()['size'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.parameters.ids(['Цвет', 'Объем', 'Длина']),
+                             {name: ids[name] for name in ('Цвет', 'Объем', 'Длина')})
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks():
+            self.assertEqual(lookups.parameters.ids(['Вес']), {'Вес': ids['Вес']})
+
+    def test_invalidate(self):
+        parameter = Parameter.objects.create(name='Цвет')
+        with self.captureOnCommitCallbacks(execute=True):
+            lookups.parameters.ids(['Цвет'])
+
+        parameter.name = 'Color'
+        parameter.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(lookups.parameters.ids(['Цвет']), {})
+            self.assertEqual(lookups.parameters.ids(['Color']), {'Color': parameter.id})
+        self.assertEqual(lookups.parameters.names([parameter.id]), {parameter.id: 'Color'})
+
+        parameter_id = parameter.id
+        parameter.delete()
+        with self.assertNumQueries(2):
+            self.assertEqual(lookups.parameters.ids(['Color']), {})
+            self.assertEqual(lookups.parameters.names([parameter_id]), {})
+
+    def test_store_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    parameter = Parameter.objects.create(name='Цвет')
+                    self.assertEqual(lookups.parameters.ids(['Цвет']), {'Цвет': parameter.id})
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(lookups.parameters.stats()['size'], 0)
+        self.assertEqual(lookups.parameters.ids(['Цвет']), {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            parameter = Parameter.objects.create(name='Цвет')
+            lookups.parameters.ids(['Цвет'])
+            self.assertEqual(lookups.parameters.stats()['size'], 0)
+        self.assertEqual(lookups.parameters.stats()['size'], 1)
+
+
+class FastSerializerTests(TestCase):
+    """
+    Быстрая сериализация дает тот же JSON, что и сериализаторы DRF
+    """
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        data = {
+            'shop': 'Магазин',
+            'categories': [{'id': number, 'name': f'Категория {number}'} for number in range(1, 4)],
+            'goods': generate_goods(30, 3, 3),
+        }
+        PriceListImporter(user.id).run(iter_feed_records(data))
+
+        buyer = User.objects.create(email='buyer@example.com', type='buyer', is_active=True)
+        contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', house='1', phone='+70000000000')
+        product_info_ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+        orders = Order.objects.bulk_create([Order(user=buyer, state='new', contact=contact if number % 2 else None)
+                                            for number in range(4)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info_id=product_info_id, quantity=number + 1)
+            for number, order in enumerate(orders)
+            for product_info_id in product_info_ids[number::5]
+        ])
+
+    def assertSameJSON(self, drf, fast):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(drf))
+
+    def test_product_infos(self):
+        drf = ProductInfoSerializer(ProductInfo.objects.select_related('shop', 'product')
+                                    .prefetch_related('product_parameters').order_by('id'), many=True).data
+        self.assertSameJSON(drf, serialize_product_infos(ProductInfo.objects.order_by('id')
+                                                         .values(*PRODUCT_INFO_FIELDS)))
+
+    def test_orders(self):
+        orders = Order.objects.exclude(state='basket')
+        drf = OrderSerializer(orders.prefetch_related('order_items__product_info__product',
+                                                      'order_items__product_info__product_parameters')
+                              .select_related('contact'), many=True).data
+        self.assertSameJSON(drf, serialize_orders(orders))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ImporterTests(TestCase):
+    """
+    Повторный импорт в режимах upsert и replace: записываются только изменения, счетчики верны
+    """
+    def setUp(self):
+        self.user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        self.goods = [{'id': number, 'category': 1, 'model': f'model-{number}', 'name': f'Товар {number}',
+                       'price': 100 * number, 'price_rrc': 120 * number, 'quantity': number,
+                       'parameters': {'Цвет': 'черный', 'Вес': number}}
+                      for number in range(1, 4)]
+        self.result = self.run_import()
+        self.ids = self.offer_ids()
+
+    def run_import(self, goods=None, mode='upsert'):
+        data = {'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Категория'}],
+                'goods': self.goods if goods is None else goods}
+        with self.captureOnCommitCallbacks(execute=True):
+            return PriceListImporter(self.user.id, mode=mode).run(iter_feed_records(data))
+
+    def offer_ids(self):
+        return dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+    def writes(self, queries):
+        return [query['sql'] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+    def counters(self, result):
+        return {name: result[name] for name in ('added', 'changed', 'unchanged', 'removed')}
+
+    def test_first_import(self):
+        self.assertEqual(self.counters(self.result), {'added': 3, 'changed': 0, 'unchanged': 0, 'removed': 0})
+        self.assertEqual(CatalogEntry.objects.count(), 3)
+
+    def test_same_feed(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_import()
+        self.assertEqual(self.writes(queries), [])
+        self.assertEqual(self.counters(result), {'added': 0, 'changed': 0, 'unchanged': 3, 'removed': 0})
+
+    def test_changes(self):
+        parameters = dict(ProductParameter.objects.values_list('pk', 'product_info_id'))
+        self.goods[0]['price'] = 150
+        self.goods[1]['parameters']['Цвет'] = 'белый'
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_import()
+        self.assertEqual(self.counters(result), {'added': 0, 'changed': 2, 'unchanged': 1, 'removed': 0})
+        self.assertEqual(self.offer_ids(), self.ids)
+
+        updates = [sql for sql in self.writes(queries) if sql.startswith('UPDATE "backend_productinfo"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn(f'IN ({self.ids[1]})', updates[0])
+        self.assertEqual(ProductInfo.objects.get(pk=self.ids[1]).price, 150)
+        self.assertEqual(CatalogEntry.objects.get(pk=self.ids[1]).price, 150)
+
+        kept = {pk for pk, product_info_id in parameters.items() if product_info_id != self.ids[2]}
+        self.assertEqual(set(ProductParameter.objects.exclude(product_info_id=self.ids[2])
+                             .values_list('pk', flat=True)), kept)
+        self.assertEqual(ProductParameter.objects.get(product_info_id=self.ids[2], parameter__name='Цвет').value,
+                         'белый')
+
+    def test_missing_offer_upsert(self):
+        buyer = User.objects.create(email='buyer@example.com', type='buyer', is_active=True)
+        basket = Order.objects.create(user=buyer, state='basket')
+        OrderItem.objects.create(order=basket, product_info_id=self.ids[3], quantity=1)
+
+        result = self.run_import(self.goods[:2])
+        self.assertEqual(self.counters(result), {'added': 0, 'changed': 0, 'unchanged': 2, 'removed': 1})
+        self.assertEqual(self.offer_ids(), self.ids)
+        self.assertEqual(ProductInfo.objects.get(pk=self.ids[3]).quantity, 0)
+        self.assertEqual(CatalogEntry.objects.get(pk=self.ids[3]).quantity, 0)
+        self.assertTrue(basket.order_items.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_import(self.goods[:2])
+        self.assertEqual(self.writes(queries), [])
+        self.assertEqual(result['removed'], 0)
+
+        result = self.run_import()
+        self.assertEqual(self.counters(result), {'added': 0, 'changed': 1, 'unchanged': 2, 'removed': 0})
+        self.assertEqual(ProductInfo.objects.get(pk=self.ids[3]).quantity, 3)
+
+    def test_missing_offer_replace(self):
+        result = self.run_import(self.goods[:2], mode='replace')
+        self.assertEqual(self.counters(result), {'added': 2, 'changed': 0, 'unchanged': 0, 'removed': 3})
+        self.assertEqual(set(self.offer_ids()), {1, 2})
+        self.assertFalse(ProductInfo.objects.filter(pk__in=self.ids.values()).exists())
+        self.assertEqual(set(CatalogEntry.objects.values_list('pk', flat=True)), set(self.offer_ids().values()))
+
+    def test_counters(self):
+        self.goods[0]['quantity'] = 7
+        goods = self.goods[:2] + [dict(self.goods[2], id=4, name='Товар 4')]
+        result = self.run_import(goods)
+        self.assertEqual(self.counters(result), {'added': 1, 'changed': 1, 'unchanged': 1, 'removed': 1})
+        self.assertEqual(set(self.offer_ids()), {1, 2, 3, 4})
+        self.assertEqual(ProductInfo.objects.filter(quantity__gt=0).count(), 3)
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """
+    Сервер прайс-листа для тестов: тело и заголовки задаются в классе, запросы запоминаются
+    """
+    body = b''
+    content_type = 'application/x-ndjson'
+    etag = ''
+    last_modified = ''
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.etag and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.content_type:
+            self.send_header('Content-Type', self.content_type)
+        self.send_header('Content-Length', str(len(self.body)))
+        if self.etag:
+            self.send_header('ETag', self.etag)
+        if self.last_modified:
+            self.send_header('Last-Modified', self.last_modified)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FeedServerTestCase(TestCase):
+    """
+    Импорт через do_import с прайс-листом из локального HTTP-сервера
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/feed.jsonl'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        FeedHandler.body = b''
+        FeedHandler.content_type = 'application/x-ndjson'
+        FeedHandler.etag = FeedHandler.last_modified = ''
+        FeedHandler.requests = []
+
+    def run_import(self, url=None, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True), redirect_stdout(io.StringIO()):
+            return do_import(url or self.url, self.user.id, **kwargs)
+
+
+class FeedFetchTests(FeedServerTestCase):
+    """
+    Условная загрузка прайс-листа: 304 и совпавший SHA-256 пропускают импорт, изменившийся прайс-лист импортируется
+    """
+    def setUp(self):
+        super().setUp()
+        self.serve(price=100, etag='"v1"', last_modified='Mon, 12 Oct 2026 10:00:00 GMT')
+        self.result = self.run_import()
+        FeedHandler.requests = []
+
+    def serve(self, price, etag='', last_modified=''):
+        lines = [{'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Категория'}]}]
+        lines += [{'id': number, 'category': 1, 'name': f'Товар {number}', 'price': price * number,
+                   'price_rrc': price * number, 'quantity': 5, 'parameters': {'Цвет': 'черный'}}
+                  for number in range(1, 4)]
+        FeedHandler.body = ''.join(dumps(line, ensure_ascii=False) + '\n' for line in lines).encode()
+        FeedHandler.etag = etag
+        FeedHandler.last_modified = last_modified
+
+    def assertSkipped(self, result, decision):
+        self.assertEqual(result['fetch']['decision'], decision)
+        self.assertEqual(result['fetch']['bytes_saved'], len(FeedHandler.body))
+        self.assertEqual(ImportRun.objects.get(id=result['run']).state, 'skipped')
+
+    def test_first_import(self):
+        self.assertEqual(self.result['fetch']['decision'], 'changed')
+        self.assertEqual(self.result['added'], 3)
+        state = PriceListState.objects.get()
+        self.assertEqual((state.url, state.etag, state.last_modified, state.size),
+                         (self.url, '"v1"', 'Mon, 12 Oct 2026 10:00:00 GMT', len(FeedHandler.body)))
+        self.assertEqual(state.digest, sha256(FeedHandler.body).hexdigest())
+
+    def test_not_modified(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_import()
+        self.assertEqual(FeedHandler.requests[0]['If-None-Match'], '"v1"')
+        self.assertEqual(FeedHandler.requests[0]['If-Modified-Since'], 'Mon, 12 Oct 2026 10:00:00 GMT')
+        self.assertSkipped(result, 'not_modified')
+        self.assertFalse([query for query in queries if 'backend_productinfo' in query['sql']])
+
+    def test_same_digest(self):
+        self.serve(price=100)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_import()
+        self.assertSkipped(result, 'unchanged')
+        self.assertFalse([query for query in queries if 'backend_productinfo' in query['sql']])
+        state = PriceListState.objects.get()
+        self.assertEqual((state.etag, state.last_modified), ('', ''))
+
+        FeedHandler.requests = []
+        self.run_import()
+        self.assertNotIn('If-None-Match', FeedHandler.requests[0])
+
+    def test_changed(self):
+        self.serve(price=150, etag='"v2"')
+        result = self.run_import()
+        self.assertEqual(result['fetch']['decision'], 'changed')
+        self.assertEqual(result['changed'], 3)
+        self.assertEqual(sorted(ProductInfo.objects.values_list('price', flat=True)), [150, 300, 450])
+        state = PriceListState.objects.get()
+        self.assertEqual((state.etag, state.digest), ('"v2"', sha256(FeedHandler.body).hexdigest()))
+
+    def test_force(self):
+        result = self.run_import(force=True)
+        self.assertNotIn('If-None-Match', FeedHandler.requests[0])
+        self.assertEqual(result['fetch']['decision'], 'changed')
+        self.assertEqual(result['unchanged'], 3)
+
+
+class FeedFormatTests(FeedServerTestCase):
+    """
+    Один и тот же прайс-лист в разных форматах и способах импорта дает одинаковые строки,
+    ошибка формата откатывает импорт целиком
+    """
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(settings.BASE_DIR, 'data', 'shop.yaml'), 'rb') as file:
+            self.yaml = file.read()
+        self.data = load_yaml(self.yaml, Loader=Loader)
+
+    def import_rows(self, body, path, **kwargs):
+        """
+        Строки предложений, параметров и каталога после импорта прайс-листа, затем магазин удаляется.
+        Запуск импорта сохраняется в self.run
+        """
+        FeedHandler.body = body
+        FeedHandler.content_type = ''
+        result = self.run_import(self.url.replace('/feed.jsonl', path), force=True, **kwargs)
+        self.run = ImportRun.objects.get(id=result['run'])
+        rows = (
+            sorted(ProductInfo.objects.values_list('external_id', 'product__name', 'product__category_id',
+                                                   'product__category__name', 'model', 'price', 'price_rrc',
+                                                   'quantity')),
+            sorted(ProductParameter.objects.values_list('product_info__external_id', 'parameter__name', 'value',
+                                                        'value_num')),
+            sorted((entry.product_name, entry.category_name, entry.price, entry.quantity,
+                    sorted((parameter['parameter'], parameter['value']) for parameter in entry.parameters))
+                   for entry in CatalogEntry.objects.all()),
+        )
+        self.assertEqual(len(rows[0]), len(self.data['goods']))
+        Shop.objects.all().delete()
+        return rows
+
+    def assertFailed(self, body, path):
+        FeedHandler.body = body
+        FeedHandler.content_type = ''
+        with self.assertRaises(FeedError):
+            self.run_import(self.url.replace('/feed.jsonl', path), force=True)
+        self.assertEqual(ImportRun.objects.latest('id').state, 'failed')
+        self.assertFalse(Shop.objects.exists())
+        self.assertFalse(ProductInfo.objects.exists())
+
+    def test_yaml(self):
+        self.assertEqual(self.import_rows(self.yaml, '/feed.yaml'),
+                         self.import_rows(self.yaml, '/feed.yaml', streaming=False))
+
+    def test_malformed_yaml(self):
+        self.assertFailed('- shop: Магазин\n'.encode(), '/feed.yaml')
+        self.assertFailed(self.yaml.replace(b'price: 110000', 'price: дорого'.encode()), '/feed.yaml')
+
+    def to_jsonl(self):
+        lines = [{'shop': self.data['shop'], 'categories': self.data['categories']}] + self.data['goods']
+        return ''.join(dumps(line, ensure_ascii=False) + '\n' for line in lines).encode()
+
+    def to_csv(self):
+        categories = {category['id']: category['name'] for category in self.data['categories']}
+        names = list(dict.fromkeys(name for good in self.data['goods'] for name in good['parameters']))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_FIELDS + tuple(names))
+        for good in self.data['goods']:
+            writer.writerow([self.data['shop'], good['category'], categories[good['category']]]
+                            + [good[field] for field in CSV_FIELDS[3:]]
+                            + [good['parameters'].get(name, '') for name in names])
+        return buffer.getvalue().encode('utf-8-sig')
+
+    def test_formats(self):
+        rows = self.import_rows(self.yaml, '/feed.yaml')
+        self.assertEqual(self.import_rows(self.to_jsonl(), '/feed.jsonl'), rows)
+        self.assertEqual(self.import_rows(self.to_csv(), '/feed.csv'), rows)
+
+    def test_malformed_jsonl(self):
+        lines = self.to_jsonl().splitlines(keepends=True)
+        self.assertFailed(b''.join(lines[:2] + [b'{"id": 1, "name": \n'] + lines[2:]), '/feed.jsonl')
+
+    def test_malformed_csv(self):
+        self.assertFailed(self.to_csv().replace(b',110000,', b',110 000,'), '/feed.csv')
+
+    def sharded(self):
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', always_eager)
+
+    @override_settings(IMPORT_CHUNK_SIZE=5)
+    def test_sharded(self):
+        self.sharded()
+        rows = self.import_rows(self.yaml, '/feed.yaml')
+        for body, path in ((self.yaml, '/feed.yaml'), (self.to_jsonl(), '/feed.jsonl'), (self.to_csv(), '/feed.csv')):
+            with self.subTest(path=path):
+                self.assertEqual(self.import_rows(body, path, sharded=True), rows)
+                self.assertEqual((self.run.state, self.run.chunks, self.run.pending_chunks, self.run.rows,
+                                  self.run.added),
+                                 ('success', 3, 0, len(self.data['goods']), len(self.data['goods'])))
+
+    @override_settings(IMPORT_CHUNK_SIZE=5)
+    def test_sharded_upsert(self):
+        self.sharded()
+        FeedHandler.body = self.to_jsonl()
+        self.run_import(sharded=True)
+        good = self.data['goods'].pop()
+        self.data['goods'][0]['price'] = 100000
+        FeedHandler.body = self.to_jsonl()
+        result = self.run_import(sharded=True)
+
+        run = ImportRun.objects.get(id=result['run'])
+        self.assertEqual((run.state, run.added, run.changed, run.removed, run.removed_ids),
+                         ('success', 0, 1, 1, []))
+        self.assertEqual(ProductInfo.objects.get(external_id=good['id']).quantity, 0)
+        self.assertEqual(ProductInfo.objects.get(external_id=self.data['goods'][0]['id']).price, 100000)
+        self.assertEqual(PriceListState.objects.get().digest, sha256(FeedHandler.body).hexdigest())
+
+
+def import_shops(shops, goods):
+    for number in range(1, shops + 1):
+        user = User.objects.create(email=f'shop-{number}@example.com', type='shop', is_active=True)
+        data = {
+            'shop': f'Магазин {number}',
+            'categories': [{'id': category, 'name': f'Категория {category}'} for category in range(1, 11)],
+            'goods': generate_goods(goods, 4, 10, seed=number),
+        }
+        PriceListImporter(user.id).run(iter_feed_records(data))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class QueryPlanTests(TestCase):
+    """
+    Список предложений с фильтрами и сортировкой использует составные индексы (EXPLAIN QUERY PLAN),
+    на первой странице и на следующей по курсору
+    """
+    # (адрес, CATALOG_READ_MODEL, таблица основного запроса, ожидаемый индекс)
+    checks = (
+        ('/api/v1/products?category_id=1&ordering=price', True, 'backend_catalogentry', 'catalog_category_price'),
+        ('/api/v1/products?category_id=1&ordering=-price&price_min=1000', True, 'backend_catalogentry',
+         'catalog_category_price'),
+        ('/api/v1/products?category_id=1&ordering=quantity&in_stock=1', True, 'backend_catalogentry',
+         'catalog_category_quantity'),
+        ('/api/v1/products?shop_id=1&ordering=price', True, 'backend_catalogentry', 'catalog_shop_price'),
+        ('/api/v1/products?ordering=price', True, 'backend_catalogentry', 'catalog_active_price'),
+        ('/api/v1/products?shop_id=1&ordering=price', False, 'backend_productinfo', 'product_info_shop_price'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        import_shops(2, 500)
+
+    def get_plan(self, url, table):
+        """
+        План основного запроса страницы: первый SELECT из table с ORDER BY, и ссылка на следующую страницу
+        """
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        sql = next((query['sql'] for query in queries
+                    if f'FROM "{table}"' in query['sql'] and 'ORDER BY' in query['sql']), None)
+        self.assertIsNotNone(sql, f'{url}: нет запроса к {table} с ORDER BY')
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return ' | '.join(row[-1] for row in cursor.fetchall()), response.json()['next']
+
+    def test_indexes(self):
+        for url, read_model, table, index in self.checks:
+            with self.subTest(url=url, read_model=read_model), override_settings(CATALOG_READ_MODEL=read_model):
+                plan, next_url = self.get_plan(url, table)
+                self.assertIn(index, plan)
+                self.assertIsNotNone(next_url)
+                plan, _ = self.get_plan(next_url, table)
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CursorPaginationTests(TestCase):
+    """
+    Курсор по всем полям сортировки: совпадающие цены и остатки не повторяются при обходе страниц,
+    в том числе когда одинаковых значений больше offset_cutoff
+    """
+    @classmethod
+    def setUpTestData(cls):
+        import_shops(1, 1500)
+        ProductInfo.objects.update(quantity=5)
+        CatalogEntry.objects.update(quantity=5)
+        ProductInfo.objects.filter(id__lte=ProductInfo.objects.order_by('id')[1300].id).update(price=1000)
+        CatalogEntry.objects.filter(product_info__price=1000).update(price=1000)
+
+    def walk(self, url):
+        ids = []
+        pages = 0
+        while url:
+            cache.clear()
+            data = self.client.get(url).json()
+            ids.extend(row['id'] for row in data['results'])
+            url = data['next']
+            pages += 1
+            self.assertLess(pages, 50, 'обход страниц не заканчивается')
+        return ids
+
+    def test_ties(self):
+        total = ProductInfo.objects.count()
+        for read_model in (True, False):
+            for ordering in ('quantity', 'price', '-price'):
+                with self.subTest(read_model=read_model, ordering=ordering), \
+                        override_settings(CATALOG_READ_MODEL=read_model):
+                    ids = self.walk(f'/api/v1/products?ordering={ordering}&page_size=100')
+                    self.assertEqual(len(ids), total)
+                    self.assertEqual(len(set(ids)), total)
+
+    def test_previous(self):
+        first = self.client.get('/api/v1/products?ordering=price&page_size=50').json()
+        second = self.client.get(first['next']).json()
+        cache.clear()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([row['id'] for row in back['results']], [row['id'] for row in first['results']])
+        self.assertIsNone(back['previous'])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class PriceFilterTests(TestCase):
+    """
+    Фильтры по цене и наличию и сортировка списка предложений для обеих моделей чтения
+    """
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        with open(os.path.join(settings.BASE_DIR, 'data', 'shop.yaml'), encoding='utf-8') as file:
+            PriceListImporter(user.id).run(iter_feed_records(load_yaml(file, Loader=Loader)))
+        info = ProductInfo.objects.order_by('pk').first()
+        ProductInfo.objects.filter(pk=info.pk).update(quantity=0)
+        CatalogEntry.objects.filter(pk=info.pk).update(quantity=0)
+        cls.prices = sorted(ProductInfo.objects.values_list('price', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def get_rows(self, params):
+        rows = []
+        for read_model in (True, False):
+            cache.clear()
+            with override_settings(CATALOG_READ_MODEL=read_model):
+                response = self.client.get('/api/v1/products', dict(params, page_size=100))
+            self.assertEqual(response.status_code, 200, response.content)
+            rows.append([(row['id'], row['price'], row['quantity']) for row in response.json()['results']])
+        self.assertEqual(rows[0], rows[1])
+        return rows[0]
+
+    def offers(self, **filters):
+        return set(ProductInfo.objects.filter(**filters).values_list('pk', flat=True))
+
+    def test_price_range(self):
+        low, high = self.prices[1], self.prices[-2]
+        self.assertEqual({row[0] for row in self.get_rows({'price_min': low})}, self.offers(price__gte=low))
+        self.assertEqual({row[0] for row in self.get_rows({'price_max': high})}, self.offers(price__lte=high))
+        self.assertEqual({row[0] for row in self.get_rows({'price_min': low, 'price_max': high})},
+                         self.offers(price__gte=low, price__lte=high))
+        self.assertEqual(self.get_rows({'price_min': high + 1, 'price_max': high}), [])
+
+    def test_in_stock(self):
+        self.assertEqual({row[0] for row in self.get_rows({'in_stock': 1})}, self.offers(quantity__gt=0))
+        self.assertEqual({row[0] for row in self.get_rows({'in_stock': 1, 'price_max': self.prices[-2]})},
+                         self.offers(quantity__gt=0, price__lte=self.prices[-2]))
+
+    def test_ordering(self):
+        for ordering, key in (('price', lambda row: (row[1], row[0])), ('-price', lambda row: (-row[1], -row[0])),
+                              ('quantity', lambda row: (row[2], row[0])), (None, lambda row: row[0])):
+            with self.subTest(ordering=ordering):
+                rows = self.get_rows({'ordering': ordering} if ordering else {})
+                self.assertEqual(len(rows), len(self.prices))
+                self.assertEqual(rows, sorted(rows, key=key))
+
+    def test_bad_params(self):
+        for params in ({'price_min': 'abc'}, {'price_max': '-5'}, {'price_min': '1.5'}, {'ordering': 'name'},
+                       {'ordering': '-quantity'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/v1/products', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['Status'], False)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FacetTests(TestCase):
+    """
+    Фильтры по параметрам, количество по значениям и его правка при изменениях вне импорта
+    """
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        with open(os.path.join(settings.BASE_DIR, 'data', 'shop.yaml'), encoding='utf-8') as file:
+            PriceListImporter(user.id).run(iter_feed_records(load_yaml(file, Loader=Loader)))
+        cls.shop = Shop.objects.get()
+
+    def setUp(self):
+        cache.clear()
+
+    def get_ids(self, params):
+        response = self.client.get('/api/v1/products', dict(params, page_size=100))
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['id'] for row in response.json()['results']}
+
+    def offers_with(self, name, **lookups):
+        return set(ProductParameter.objects.filter(parameter__name=name, **lookups)
+                   .values_list('product_info_id', flat=True))
+
+    def test_param(self):
+        self.assertEqual(self.get_ids({'param': 'Цвет:черный'}), self.offers_with('Цвет', value='черный'))
+        self.assertEqual(self.get_ids({'param': 'Цвет:фиолетовый'}), set())
+        self.assertEqual(self.get_ids({'param': 'Нет такого:1'}), set())
+
+    def test_param_range(self):
+        name = 'Встроенная память (Гб)'
+        self.assertEqual(self.get_ids({'param_min': f'{name}:256'}), self.offers_with(name, value_num__gte=256))
+        self.assertEqual(self.get_ids({'param_min': f'{name}:64', 'param_max': f'{name}:256'}),
+                         self.offers_with(name, value_num__gte=64, value_num__lte=256))
+        self.assertEqual(self.get_ids({'param_min': f'{name}:256', 'param': 'Цвет:черный'}),
+                         self.offers_with(name, value_num__gte=256) & self.offers_with('Цвет', value='черный'))
+
+    def test_bad_filters(self):
+        for params in ({'param': 'Цвет'}, {'param_min': 'Встроенная память (Гб):много'}, {'param_max': ':1'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/v1/products', params).status_code, 400)
+
+    def test_facet_counts(self):
+        facets = self.client.get('/api/v1/products', {'facets': 1}).json()['facets']
+        self.assertEqual(facets['Цвет']['черный'], len(self.offers_with('Цвет', value='черный')))
+
+        cache.clear()
+        facets = self.client.get('/api/v1/products', {'facets': 1, 'param': 'Цвет:черный'}).json()['facets']
+        self.assertEqual(facets['Цвет'], {'черный': len(self.offers_with('Цвет', value='черный'))})
+
+    def assertFacetsUpToDate(self):
+        """
+        Поправленные построчно количества совпадают с полным пересчетом
+        """
+        rows = list(ParameterFacet.objects.order_by('category', 'parameter', 'value')
+                    .values_list('category', 'parameter', 'value', 'count'))
+        rebuild_facets(self.shop.id)
+        self.assertEqual(rows, list(ParameterFacet.objects.order_by('category', 'parameter', 'value')
+                                    .values_list('category', 'parameter', 'value', 'count')))
+
+    def test_parameter_change(self):
+        product_parameter = ProductParameter.objects.filter(parameter__name='Цвет', value='черный').first()
+        product_parameter.value = 'фиолетовый'
+        product_parameter.save()
+        self.assertFacetsUpToDate()
+        self.assertEqual(self.get_ids({'param': 'Цвет:фиолетовый'}), {product_parameter.product_info_id})
+
+    def test_parameter_added_and_deleted(self):
+        product_info = ProductInfo.objects.first()
+        ProductParameter.objects.create(product_info=product_info, parameter=Parameter.objects.create(name='Вес'),
+                                        value='200')
+        self.assertFacetsUpToDate()
+        ProductParameter.objects.filter(product_info=product_info).first().delete()
+        self.assertFacetsUpToDate()
+
+    def test_offer_deleted(self):
+        ProductInfo.objects.first().delete()
+        self.assertFacetsUpToDate()
+
+    def test_category_change(self):
+        product = Product.objects.filter(category__name='Смартфоны').first()
+        product.category = Category.objects.get(name='Телевизоры')
+        product.save()
+        self.assertFacetsUpToDate()
+
+    def test_offer_moved_to_other_product(self):
+        product_info = ProductInfo.objects.filter(product__category__name='Смартфоны').first()
+        product_info.product = Product.objects.create(name='Телевизор',
+                                                      category=Category.objects.get(name='Телевизоры'))
+        product_info.save()
+        self.assertFacetsUpToDate()
+
+    def test_one_edit_does_not_rebuild_shop(self):
+        product_parameter = ProductParameter.objects.first()
+        product_parameter.value = 'другое'
+        with CaptureQueriesContext(connection) as queries:
+            product_parameter.save()
+        self.assertFalse([query for query in queries if 'DELETE FROM "backend_parameterfacet" WHERE'
+                          ' "backend_parameterfacet"."shop_id"' in query['sql']])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SearchTests(TestCase):
+    """
+    Полнотекстовый поиск по названию, модели и значениям параметров (FTS5)
+    """
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        with open(os.path.join(settings.BASE_DIR, 'data', 'shop.yaml'), encoding='utf-8') as file:
+            PriceListImporter(user.id).run(iter_feed_records(load_yaml(file, Loader=Loader)))
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, **params):
+        response = self.client.get('/api/v1/products/search', dict(params, page_size=100))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_words_and_prefixes(self):
+        iphones = set(CatalogEntry.objects.filter(product_name__icontains='iphone').values_list('pk', flat=True))
+        self.assertTrue(iphones)
+        for query in ('iphone', 'IPHONE', 'iph', 'смартфон iphone'):
+            with self.subTest(query=query):
+                data = self.search(q=query)
+                self.assertEqual({row['id'] for row in data['results']}, iphones)
+                self.assertEqual(data['count'], len(iphones))
+        self.assertEqual(self.search(q='iphone xr')['count'],
+                         CatalogEntry.objects.filter(product_name__icontains='iphone xr').count())
+        self.assertEqual(self.search(q='телепорт')['results'], [])
+
+    def test_model_and_parameters(self):
+        entry = CatalogEntry.objects.filter(model__contains='xs-max').first()
+        self.assertIn(entry.pk, {row['id'] for row in self.search(q='xs max')['results']})
+        golden = {row['id'] for row in self.search(q='золотистый')['results']}
+        self.assertEqual(golden, set(ProductParameter.objects.filter(value='золотистый')
+                                     .values_list('product_info_id', flat=True)))
+
+    def test_filters_and_pages(self):
+        category = Category.objects.get(name='Смартфоны')
+        data = self.search(q='смартфон', category_id=category.id)
+        names = CatalogEntry.objects.filter(category=category).values_list('product_name', flat=True)
+        self.assertEqual(data['count'], sum('смартфон' in name.lower() for name in names))
+        self.assertLessEqual({row['id'] for row in data['results']},
+                             set(CatalogEntry.objects.filter(category=category).values_list('pk', flat=True)))
+        self.assertEqual(self.search(q='смартфон', shop_id=10 ** 6)['count'], 0)
+
+        first = self.client.get('/api/v1/products/search', {'q': 'смартфон', 'page_size': 2}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertFalse({row['id'] for row in first['results']} & {row['id'] for row in second['results']})
+
+    def test_empty_query(self):
+        for params in ({}, {'q': ''}, {'q': '  '}, {'q': '!?*'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/v1/products/search', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['Status'], False)
+
+
+class ExportTests(TestCase):
+    """
+    Потоковая выгрузка каталога в JSON Lines и CSV, в том числе сжатая gzip
+    """
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        with open(os.path.join(settings.BASE_DIR, 'data', 'shop.yaml'), encoding='utf-8') as file:
+            PriceListImporter(user.id).run(iter_feed_records(load_yaml(file, Loader=Loader)))
+        cls.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=user).key}'}
+
+    def export(self, **params):
+        response = self.client.get('/api/v1/products/export', params, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_jsonl(self):
+        response, content = self.export(export_format='jsonl')
+        self.assertEqual(response['Content-Type'], EXPORT_FORMATS['jsonl'])
+        rows = [loads(line) for line in content.decode().splitlines()]
+        entries = CatalogEntry.objects.order_by('pk')
+        self.assertEqual([row['id'] for row in rows], [entry.pk for entry in entries])
+        for row, entry in zip(rows, entries):
+            self.assertEqual((row['model'], row['product']['name'], row['price'], row['product_parameters']),
+                             (entry.model, entry.product_name, entry.price, entry.parameters))
+
+    def test_text_is_not_escaped(self):
+        _, content = self.export(export_format='jsonl')
+        model = CatalogEntry.objects.filter(model__contains='/').values_list('model', flat=True).first()
+        self.assertIn(f'"model":"{model}"'.encode(), content)
+        self.assertNotIn(b'\\/', content)
+        self.assertNotIn(b'\\u', content)
+        self.assertIn('Смартфон'.encode(), content)
+
+    def test_csv(self):
+        response, content = self.export(export_format='csv', shop_id=Shop.objects.get().id)
+        self.assertEqual(response['Content-Type'], EXPORT_FORMATS['csv'])
+        header, *rows = csv.reader(io.StringIO(content.decode()))
+        self.assertEqual(tuple(header), CSV_COLUMNS)
+        self.assertEqual([int(row[0]) for row in rows], list(CatalogEntry.objects.order_by('pk')
+                                                              .values_list('pk', flat=True)))
+        entry = CatalogEntry.objects.order_by('pk').first()
+        self.assertEqual(rows[0][4:7], [entry.product_name, entry.model, str(entry.price)])
+        self.assertEqual(loads(rows[0][-1]), {parameter['parameter']: parameter['value']
+                                              for parameter in entry.parameters})
+        self.assertNotIn('\\/', rows[0][-1])
+
+    def test_gzip(self):
+        for export_format in EXPORT_FORMATS:
+            with self.subTest(export_format=export_format):
+                _, plain = self.export(export_format=export_format)
+                response, content = self.export(export_format=export_format, gzip=1)
+                self.assertEqual(response['Content-Type'], 'application/gzip')
+                self.assertIn(f'catalog.{export_format}.gz', response['Content-Disposition'])
+                self.assertEqual(gzip.decompress(content), plain)
+
+    def test_small_blocks(self):
+        rows = list(export_entries())
+        plain = b''.join(iter_export(rows, 'jsonl'))
+        blocks = list(iter_export(rows, 'jsonl', compress=True, buffer_size=100))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(gzip.decompress(b''.join(blocks)), plain)
+
+    def test_filters_and_errors(self):
+        _, content = self.export(category_id=10 ** 6)
+        self.assertEqual(content, b'')
+        response = self.client.get('/api/v1/products/export', {'export_format': 'xml'}, **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/products/export').status_code, 403)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CatalogCacheTests(TestCase):
+    """
+    Кеш ответов каталога по версиям: попадание, сброс при изменениях и статистика
+    """
+    @classmethod
+    def setUpTestData(cls):
+        import_shops(1, 20)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_request_is_hit(self):
+        for url in ('/api/v1/products', '/api/v1/categories', '/api/v1/shops'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+                self.assertEqual(second.content, first.content)
+
+    def test_changes_invalidate(self):
+        product_info = ProductInfo.objects.first()
+        changes = (
+            ('/api/v1/products', product_info.save),
+            (f'/api/v1/products?shop_id={product_info.shop_id}', product_info.save),
+            ('/api/v1/products', lambda: Category.objects.first().save()),
+            ('/api/v1/categories', lambda: Category.objects.first().save()),
+            ('/api/v1/shops', lambda: Shop.objects.get().save()),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                response = self.client.get(url)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_not_modified(self):
+        for url in ('/api/v1/products?ordering=price', '/api/v1/categories', '/api/v1/shops'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(self.client.get(url, headers={'If-None-Match': '"other"'}).status_code, 200)
+
+    def test_stats_do_not_expire(self):
+        self.client.get('/api/v1/categories')
+        self.client.get('/api/v1/categories')
+        self.assertEqual(cache.get_many(['catalog:hits', 'catalog:misses']), {'catalog:hits': 1, 'catalog:misses': 1})
+        self.assertIsNone(cache._expire_info[cache.make_key('catalog:hits')])
+
+
+class AsyncMiddlewareTests(TestCase):
+    """
+    Под ASGI цепочка middleware асинхронная и асинхронные представления не переводятся в поток
+    """
+    @override_settings(DEBUG=True)
+    async def test_no_adapted_middleware(self):
+        await Category.objects.acreate(name='Категория')
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            response = await AsyncClient().get('/api/v1/async/categories')
+        self.assertEqual(response.json()['results'][0]['name'], 'Категория')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class AsyncViewTests(TestCase):
+    """
+    Асинхронные представления отдают то же, что синхронные: фильтры, курсор, facets, кеш и ETag общие
+    """
+    @classmethod
+    def setUpTestData(cls):
+        import_shops(2, 60)
+        buyer = User.objects.create(email='buyer@example.com', type='buyer', is_active=True)
+        cls.headers = {'Authorization': f'Token {Token.objects.create(user=buyer).key}'}
+        basket = Order.objects.create(user=buyer, state='basket')
+        OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=product_info, quantity=1)
+                                       for product_info in ProductInfo.objects.all()[:3]])
+
+    async def get_both(self, url, headers=None):
+        """
+        Ответы синхронного и асинхронного представления, ссылки асинхронного приведены к синхронному адресу
+        """
+        sync = await sync_to_async(self.client.get)(f'/api/v1/{url}', headers=headers)
+        asynchronous = await self.async_client.get(f'/api/v1/async/{url}', headers=headers)
+        self.assertEqual(asynchronous.status_code, sync.status_code, url)
+        return sync.json(), loads(asynchronous.content.decode().replace('/api/v1/async/', '/api/v1/'))
+
+    async def test_same_payload(self):
+        for url in ('categories', 'shops', 'products', 'products?shop_id=1&ordering=price&page_size=7&facets=1',
+                    'products?ordering=-price&price_min=50000&in_stock=1&page_size=5',
+                    'products?' + urlencode({'param_min': 'Встроенная память (Гб):128', 'ordering': 'quantity',
+                                             'facets': 1})):
+            with self.subTest(url=url):
+                sync, asynchronous = await self.get_both(url)
+                self.assertEqual(asynchronous, sync)
+                if sync.get('next'):
+                    next_url = sync['next'].split('/api/v1/', 1)[1]
+                    self.assertEqual(*reversed(await self.get_both(next_url)))
+
+    async def test_errors(self):
+        for url in ('products?ordering=name', 'products?price_min=1.5', 'products?param=Color'):
+            with self.subTest(url=url):
+                sync, asynchronous = await self.get_both(url)
+                self.assertEqual(asynchronous, sync)
+        response = await self.async_client.get('/api/v1/async/categories?page=100')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_basket(self):
+        sync, asynchronous = await self.get_both('basket', self.headers)
+        self.assertEqual(asynchronous, sync)
+        self.assertEqual(len(sync[0]['ordered_items']), 3)
+        response = await self.async_client.get('/api/v1/async/basket')
+        self.assertEqual(response.status_code, 403)
+
+    async def test_cache_and_etag(self):
+        first = await self.async_client.get('/api/v1/async/products?ordering=price')
+        second = await self.async_client.get('/api/v1/async/products?ordering=price')
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(second.content, first.content)
+        response = await self.async_client.get('/api/v1/async/products?ordering=price',
+                                               headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(CACHES=LOCAL_CACHES, REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(TestCase):
+    """
+    Чтение из реплики и основной базы на двух файлах SQLite: в реплике свои данные,
+    поэтому по ответу видно, из какой базы он прочитан
+    """
+    databases = {'default', 'replica1'}
+
+    @classmethod
+    def setUpTestData(cls):
+        for database, prefix in (('default', ''), ('replica1', 'Реплика ')):
+            user = User.objects.using(database).create(id=1, email='buyer@example.com', type='buyer',
+                                                       is_active=True)
+            Token.objects.using(database).create(user=user, key='k' * 40)
+            Category.objects.using(database).create(id=1, name=f'{prefix}Категория')
+            shop = Shop.objects.using(database).create(id=1, name=f'{prefix}Магазин')
+            product = Product.objects.using(database).create(id=1, name='Товар', category_id=1)
+            ProductInfo.objects.using(database).create(id=1, product=product, shop=shop, model='m', quantity=5,
+                                                       price=10, price_rrc=11)
+            Order.objects.using(database).create(id=1, user=user, state='new' if prefix else 'basket')
+        cls.headers = {'HTTP_AUTHORIZATION': 'Token ' + 'k' * 40}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_from_replica(self):
+        self.assertEqual(self.client.get('/api/v1/categories').json()['results'][0]['name'], 'Реплика Категория')
+        self.assertEqual(self.client.get('/api/v1/shops').json()['results'][0]['name'], 'Реплика Магазин')
+
+    def test_pinned_after_write(self):
+        self.assertEqual(len(self.client.get('/api/v1/order', **self.headers).json()), 1)
+        response = self.client.post('/api/v1/basket', {'items': '[{"product_info": 1, "quantity": 1}]'},
+                                    **self.headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(OrderItem.objects.using('replica1').count(), 0)
+        self.assertEqual(self.client.get('/api/v1/order', **self.headers).json(), [])
+
+    def test_primary_after_catalog_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_shop(1)
+        self.assertEqual(self.client.get('/api/v1/shops').json()['results'][0]['name'], 'Магазин')
+
+        cache.clear()
+        self.assertEqual(self.client.get('/api/v1/shops').json()['results'][0]['name'], 'Реплика Магазин')
+
+
+class CheckoutTestCase(TestCase):
+    """
+    Покупатель с корзиной из двух предложений разных магазинов; задачи Celery выполняются сразу
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    @classmethod
+    def tearDownClass(cls):
+        celery_app.conf.task_always_eager = cls.always_eager
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Категория')
+        cls.product_infos = []
+        for number in range(2):
+            shop = Shop.objects.create(name=f'Магазин {number}')
+            product = Product.objects.create(name=f'Товар {number}', category=category)
+            cls.product_infos.append(ProductInfo.objects.create(product=product, shop=shop, model='m', quantity=10,
+                                                                price=100 * (number + 1), price_rrc=1))
+        cls.buyer = User.objects.create(email='buyer@example.com', type='buyer', is_active=True)
+        cls.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=cls.buyer).key}'}
+        cls.contact = Contact.objects.create(user=cls.buyer, city='Москва', street='Тверская', phone='+70000000000')
+        cls.basket = Order.objects.create(user=cls.buyer, state='basket')
+        cls.items = [OrderItem.objects.create(order=cls.basket, product_info=product_info, quantity=2)
+                     for product_info in cls.product_infos]
+
+    def checkout(self, order=None, headers=None):
+        order = order or self.basket
+        return self.client.post('/api/v1/order', {'id': str(order.id), 'contact': str(self.contact.id)},
+                                **(headers or self.headers))
+
+    def put_items(self, items):
+        return self.client.put('/api/v1/basket', {'items': items}, content_type='application/json', **self.headers)
+
+
+class BasketUpdateTests(CheckoutTestCase):
+    """
+    Изменение количества позиций корзины
+    """
+    def test_update(self):
+        response = self.put_items([{'id': self.items[0].id, 'quantity': 3}])
+        self.assertEqual(response.json(), {'Status': True, 'Objects updated': 1})
+        self.basket.refresh_from_db()
+        self.assertEqual(self.basket.total_sum, 3 * 100 + 2 * 200)
+
+    def test_placed_order_is_not_changed(self):
+        self.assertEqual(self.checkout().status_code, 200)
+        response = self.put_items([{'id': self.items[0].id, 'quantity': 5}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(self.items[0].id), response.json()['Errors'])
+
+        self.items[0].refresh_from_db()
+        self.product_infos[0].refresh_from_db()
+        self.basket.refresh_from_db()
+        self.assertEqual(self.items[0].quantity, 2)
+        self.assertEqual(self.product_infos[0].quantity, 8)
+        self.assertEqual(self.basket.total_sum, 2 * 100 + 2 * 200)
+
+
+class BasketBulkTests(TestCase):
+    """
+    Корзина из 200 позиций: число запросов не зависит от числа позиций, ошибки по позициям, без частичных записей
+    """
+    @classmethod
+    def setUpTestData(cls):
+        shop = Shop.objects.create(name='Магазин')
+        category = Category.objects.create(name='Категория')
+        products = Product.objects.bulk_create([Product(name=f'Товар {number}', category=category)
+                                                for number in range(200)])
+        cls.product_infos = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, model='m', quantity=10, price=100, price_rrc=1)
+            for product in products])
+        cls.buyer = User.objects.create(email='buyer@example.com', type='buyer', is_active=True)
+        cls.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=cls.buyer).key}'}
+
+    def post_items(self, items):
+        return self.client.post('/api/v1/basket', {'items': dumps(items)}, **self.headers)
+
+    def basket_items(self):
+        return dict(OrderItem.objects.filter(order__user=self.buyer, order__state='basket')
+                    .values_list('product_info_id', 'quantity'))
+
+    def test_add_queries(self):
+        def items(count, quantity=1):
+            return [{'product_info': product_info.id, 'quantity': quantity}
+                    for product_info in self.product_infos[:count]]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post_items(items(1)).json(), {'Status': True, 'Objects created': 1,
+                                                                'Objects updated': 0})
+        Order.objects.filter(user=self.buyer).delete()
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.post_items(items(200)).json(), {'Status': True, 'Objects created': 200,
+                                                                  'Objects updated': 0})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.post_items(items(1, 2))
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.post_items(items(200, 3)).json(), {'Status': True, 'Objects created': 0,
+                                                                     'Objects updated': 200})
+        self.assertEqual(set(self.basket_items().values()), {3})
+        self.assertEqual(Order.objects.get(user=self.buyer).total_sum, 200 * 3 * 100)
+
+    def test_add_and_update(self):
+        first, second, third = self.product_infos[:3]
+        self.post_items([{'product_info': first.id, 'quantity': 1}, {'product_info': second.id, 'quantity': 1}])
+        response = self.post_items([{'product_info': second.id, 'quantity': 4},
+                                    {'product_info': third.id, 'quantity': 2},
+                                    {'product_info': str(third.id), 'quantity': '3'}])
+        self.assertEqual(response.json(), {'Status': True, 'Objects created': 1, 'Objects updated': 1})
+        self.assertEqual(self.basket_items(), {first.id: 1, second.id: 4, third.id: 5})
+
+    def test_add_errors(self):
+        first, second = self.product_infos[:2]
+        response = self.post_items([{'product_info': first.id, 'quantity': 1},
+                                    {'product_info': second.id, 'quantity': 11},
+                                    {'product_info': 10 ** 6, 'quantity': 1}])
+        self.assertEqual(response.json(), {'Status': False, 'Errors': {
+            str(second.id): 'Недостаточно товара, в наличии 10',
+            str(10 ** 6): 'Предложение не найдено',
+        }})
+        self.assertEqual(self.basket_items(), {})
+
+        for items in ([], [{'product_info': first.id}], [{'product_info': first.id, 'quantity': 0}],
+                      [{'product_info': 'один', 'quantity': 1}], [{'product_info': first.id, 'quantity': True}]):
+            with self.subTest(items=items):
+                self.assertEqual(self.post_items(items).json()['Status'], False)
+        self.assertEqual(self.basket_items(), {})
+
+
+    def put_items(self, items, headers=None):
+        return self.client.put('/api/v1/basket', {'items': items}, content_type='application/json',
+                               **(headers or self.headers))
+
+    def fill_basket(self, count):
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        return OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=product_info, quantity=1)
+                                              for product_info in self.product_infos[:count]])
+
+    def test_update_queries(self):
+        items = self.fill_basket(200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.put_items([{'id': items[0].id, 'quantity': 2}]).json(),
+                             {'Status': True, 'Objects updated': 1})
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.put_items([{'id': item.id, 'quantity': 3} for item in items]).json(),
+                             {'Status': True, 'Objects updated': 200})
+        self.assertEqual(set(self.basket_items().values()), {3})
+        self.assertEqual(Order.objects.get(user=self.buyer).total_sum, 200 * 3 * 100)
+
+    def test_update_errors(self):
+        first, second, third = self.fill_basket(3)
+        other = User.objects.create(email='other@example.com', type='buyer', is_active=True)
+        foreign = OrderItem.objects.create(order=Order.objects.create(user=other, state='basket'),
+                                           product_info=self.product_infos[0], quantity=1)
+        response = self.put_items([{'id': first.id, 'quantity': 5}, {'id': second.id, 'quantity': 11},
+                                   {'id': foreign.id, 'quantity': 1}, {'id': 10 ** 6, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['Errors'], {
+            str(second.id): 'Недостаточно товара, в наличии 10',
+            str(foreign.id): f'Order item with id {foreign.id} does not exist',
+            str(10 ** 6): f'Order item with id {10 ** 6} does not exist',
+        })
+
+        response = self.put_items([{'id': first.id, 'quantity': 5}, {'id': third.id, 'quantity': 0},
+                                   {'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['Errors']), {str(third.id), 'items[2]'})
+
+        self.assertEqual(set(self.basket_items().values()), {1})
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.quantity, 1)
+
+class BackfillOrderTotalsTests(CheckoutTestCase):
+    """
+    Пересчет сохраненных сумм не меняет суммы оформленных заказов
+    """
+    def test_placed_orders_keep_checkout_totals(self):
+        self.assertEqual(self.checkout().status_code, 200)
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        OrderItem.objects.create(order=basket, product_info=self.product_infos[0], quantity=1)
+        ProductInfo.objects.filter(id=self.product_infos[0].id).update(price=1000)
+
+        call_command('backfill_order_totals', stdout=io.StringIO())
+        self.assertEqual(Order.objects.get(id=self.basket.id).total_sum, 2 * 100 + 2 * 200)
+        self.assertEqual(Order.objects.get(id=basket.id).total_sum, 1000)
+
+
+class CheckoutTests(CheckoutTestCase):
+    """
+    Оформление заказа с резервом остатков
+    """
+    def test_reserve(self):
+        self.assertEqual(self.checkout().json(), {'Status': True})
+        self.assertEqual([product_info.quantity for product_info in ProductInfo.objects.order_by('id')], [8, 8])
+        self.assertEqual(list(CatalogEntry.objects.order_by('pk').values_list('quantity', flat=True)), [8, 8])
+        self.assertEqual(Order.objects.get(id=self.basket.id).state, 'new')
+
+    def test_rollback_with_per_item_errors(self):
+        ProductInfo.objects.filter(id=self.product_infos[1].id).update(quantity=1)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['Errors'], {str(self.items[1].id): 'Недостаточно товара, в наличии 1'})
+
+        self.assertEqual([product_info.quantity for product_info in ProductInfo.objects.order_by('id')], [10, 1])
+        basket = Order.objects.get(id=self.basket.id)
+        self.assertEqual((basket.state, basket.contact_id), ('basket', None))
+        self.assertFalse(basket.shop_orders.exists())
+
+    def test_other_users_basket(self):
+        other = User.objects.create(email='other@example.com', type='buyer', is_active=True)
+        headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=other).key}'}
+        self.assertEqual(self.checkout(headers=headers).json()['Status'], False)
+        self.assertEqual(Order.objects.get(id=self.basket.id).state, 'basket')
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """
+    Параллельное оформление заказов на один товар: остаток не уходит в минус,
+    лишние покупатели получают 409
+    """
+    buyers = 12
+    stock = 5
+
+    def setUp(self):
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        shop = Shop.objects.create(name='Магазин')
+        product = Product.objects.create(name='Товар', category=Category.objects.create(name='Категория'))
+        self.product_info = ProductInfo.objects.create(product=product, shop=shop, model='m', price=100,
+                                                       price_rrc=120, quantity=self.stock)
+        self.orders = []
+        for number in range(self.buyers):
+            user = User.objects.create(email=f'buyer-{number}@example.com', type='buyer', is_active=True)
+            contact = Contact.objects.create(user=user, city='Москва', street='Тверская', phone='+70000000000')
+            order = Order.objects.create(user=user, state='basket')
+            OrderItem.objects.create(order=order, product_info=self.product_info, quantity=1)
+            self.orders.append((Token.objects.create(user=user).key, order.id, contact.id))
+
+    def tearDown(self):
+        celery_app.conf.task_always_eager = self.always_eager
+
+    def checkout(self, order):
+        token, order_id, contact_id = order
+        try:
+            return Client().post('/api/v1/order', {'id': str(order_id), 'contact': str(contact_id)},
+                                 HTTP_AUTHORIZATION=f'Token {token}').status_code
+        finally:
+            connections.close_all()
+
+    def test_no_overselling(self):
+        with ThreadPoolExecutor(6) as executor:
+            statuses = list(executor.map(self.checkout, self.orders))
+
+        self.assertEqual(sorted(statuses), [200] * self.stock + [409] * (self.buyers - self.stock))
+        self.product_info.refresh_from_db()
+        self.assertEqual(self.product_info.quantity, 0)
+        self.assertEqual(Order.objects.filter(state='new').count(), self.stock)
+
+
+class PartnerOrdersTests(CheckoutTestCase):
+    """
+    Заказы партнера: только позиции магазина и их сумма на момент оформления, постранично
+    """
+    def owner_headers(self, product_info):
+        owner = User.objects.create(email=f'shop-{product_info.shop_id}@example.com', type='shop', is_active=True)
+        Shop.objects.filter(id=product_info.shop_id).update(user=owner)
+        return {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=owner).key}'}
+
+    def test_shop_lines_and_subtotal(self):
+        self.assertEqual(self.checkout().status_code, 200)
+        for product_info in self.product_infos:
+            headers = self.owner_headers(product_info)
+            orders = self.client.get('/api/v1/partner/orders', **headers).json()['results']
+            self.assertEqual(len(orders), 1)
+            items = orders[0]['ordered_items']
+            self.assertEqual([item['product_info']['id'] for item in items], [product_info.id])
+            self.assertEqual(orders[0]['total_sum'], 2 * product_info.price)
+            self.assertEqual(self.client.get('/api/v1/partner/orders?state=sent', **headers).json()['results'], [])
+            self.assertEqual(self.client.get('/api/v1/partner/orders/counts', **headers).json(),
+                             {'Status': True, 'counts': {'new': 1}})
+
+    def test_price_change_after_checkout(self):
+        self.assertEqual(self.checkout().status_code, 200)
+        headers = self.owner_headers(self.product_infos[0])
+        product_info = ProductInfo.objects.get(id=self.product_infos[0].id)
+        product_info.price = 1000
+        product_info.save()
+        order = Order.objects.get(id=self.basket.id)
+        order.state = 'confirmed'
+        order.save()
+
+        orders = self.client.get('/api/v1/partner/orders?state=confirmed', **headers).json()['results']
+        self.assertEqual(orders[0]['total_sum'], 2 * 100)
+        self.assertEqual(Order.objects.get(id=self.basket.id).total_sum, 2 * 100 + 2 * 200)
+
+    def test_pages(self):
+        headers = self.owner_headers(self.product_infos[0])
+        order_ids = [self.basket.id]
+        self.assertEqual(self.checkout().status_code, 200)
+        for _ in range(4):
+            basket = Order.objects.create(user=self.buyer, state='basket')
+            OrderItem.objects.create(order=basket, product_info=self.product_infos[0], quantity=1)
+            self.assertEqual(self.checkout(basket).status_code, 200)
+            order_ids.append(basket.id)
+
+        ids = []
+        url = '/api/v1/partner/orders?state=new&page_size=2'
+        while url:
+            with self.assertNumQueries(7):
+                data = self.client.get(url, **headers).json()
+            ids.extend(order['id'] for order in data['results'])
+            url = data['next']
+        self.assertEqual(ids, order_ids[::-1])
@@ -1,6 +1,8 @@
 from django.urls import path
 
-from backend.views import PartnerUpdate, PartnerState, PartnerOrders, ContactView, CategoryView, ProductInfoView, ShopView, BasketView, OrderView
+from backend.async_views import AsyncBasketView, AsyncCategoryView, AsyncProductInfoView, AsyncShopView
+from backend.views import PartnerUpdate, PartnerState, PartnerOrders, PartnerImportStatus, ContactView, CategoryView, ProductInfoView, ShopView, BasketView, OrderView, CatalogCacheStats, \
+    ProductSearchView, ProductExportView, PartnerOrderCounts
 
 app_name = 'backend'
 
@@ -8,10 +10,19 @@ urlpatterns = [
     path('partner-update/', PartnerUpdate.as_view(), name='partner_update'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
+    path('partner/orders/counts', PartnerOrderCounts.as_view(), name='partner-order-counts'),
+    path('partner/import-status', PartnerImportStatus.as_view(), name='partner-import-status'),
     path('user/contact', ContactView.as_view(), name='user-contact'),
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
     path('products', ProductInfoView.as_view(), name='shops'),
+    path('products/search', ProductSearchView.as_view(), name='products-search'),
+    path('products/export', ProductExportView.as_view(), name='products-export'),
+    path('catalog/cache-stats', CatalogCacheStats.as_view(), name='catalog-cache-stats'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
+    path('async/categories', AsyncCategoryView.as_view(), name='async-categories'),
+    path('async/shops', AsyncShopView.as_view(), name='async-shops'),
+    path('async/products', AsyncProductInfoView.as_view(), name='async-products'),
+    path('async/basket', AsyncBasketView.as_view(), name='async-basket'),
 ]
\ No newline at end of file
@@ -1,33 +1,69 @@
 from distutils.util import strtobool
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.core.validators import URLValidator
-from django.db.models import Q, F, Sum
-from rest_framework.request import Request
+from django.db.models import Count, Q
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import ListAPIView
-from requests import get
 from ujson import loads as load_json
-from yaml import load as load_yaml, Loader
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from rest_framework import status
 
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Contact, Order, OrderItem
-from backend.serializers import ContactSerializer, CategorySerializer, ShopSerializer, ProductSerializer, ProductInfoSerializer, OrderSerializer, OrderItemSerializer
+from backend.basket import add_basket_items, check_stock, parse_basket_items, update_basket_items
+from backend.catalog import set_shop_state
+from backend.catalog_cache import CachedListMixin, bump_shop, cache_stats
+from backend.export import EXPORT_FORMATS, export_entries, iter_export
+from backend.facets import facet_counts, filter_by_parameters, parse_parameter_filters
+from backend.fast_serializers import FastProductInfoSerializer, PRODUCT_INFO_FIELDS, serialize_orders
+from backend.importer import load_progress
+from backend.models import Shop, Category, Product, ProductInfo, Contact, Order, OrderItem, ImportRun, CatalogEntry, \
+    ShopOrder, STATE_CHOICES
+from backend.orders import deferred_order_totals, place_order
+from backend.pagination import ProductInfoCursorPagination, SearchPagination, ShopOrderCursorPagination
+from backend.routers import ReplicaReadMixin
+from backend.search import SearchResults, search_terms
+from backend.serializers import ContactSerializer, CategorySerializer, ShopSerializer, ProductSerializer, ImportRunSerializer, CatalogEntrySerializer
 from shop.tasks import do_import
 from backend.signals import new_order
 
+ORDER_STATES = {state for state, _ in STATE_CHOICES} - {'basket'}
+
+
+def parse_product_filters(query_params):
+    """
+    Фильтры списка предложений из строки запроса: (условия по цене и наличию, фильтры по параметрам).
+    ValueError с текстом ошибки при неизвестной сортировке или неправильном значении
+    """
+    ordering = query_params.get('ordering')
+    if ordering and ordering not in ProductInfoCursorPagination.ordering_options:
+        raise ValueError(f'Неизвестная сортировка: {ordering}')
+
+    filters = {}
+    for name, lookup in (('price_min', 'price__gte'), ('price_max', 'price__lte')):
+        value = query_params.get(name)
+        if value:
+            if not value.isdigit():
+                raise ValueError(f'{name} должен быть целым числом')
+            filters[lookup] = int(value)
+    if query_params.get('in_stock') in ('1', 'true', 'yes'):
+        filters['quantity__gt'] = 0
+    return filters, parse_parameter_filters(query_params)
+
 
 class PartnerUpdate(APIView):
     """
     Класс для обновления прайса от поставщика
     """
-    def run_import_task(self, url, user_id):
+    def run_import_task(self, url, user_id, feed_format=None):
         """
         Метод для запуска задачи импорта в Celery
         """
-        do_import.delay(url, user_id)
+        run = ImportRun.objects.create(user_id=user_id, url=url)
+        result = do_import.delay(url, user_id, run_id=run.id, feed_format=feed_format)
+        ImportRun.objects.filter(id=run.id, task_id='').update(task_id=result.id)
+        return run
 
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -38,6 +74,22 @@ class PartnerUpdate(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
+        url = request.data.get('url')
+        feed_format = request.data.get('feed_format')
+        if feed_format and feed_format not in ('yaml', 'jsonl', 'csv'):
+            return JsonResponse({'Status': False, 'Error': 'Формат прайса: yaml, jsonl или csv'})
+        if url:
+            validate_url = URLValidator()
+            try:
+                validate_url(url)
+            except ValidationError as error:
+                return JsonResponse({'Status': False, 'Error': str(error)})
+            else:
+                run = self.run_import_task(url, request.user.id, feed_format)
+                return JsonResponse({'Status': True, 'run': run.id})
+
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
 
 class ContactView(APIView):
     """
@@ -112,7 +164,7 @@ class ContactView(APIView):
         return required_fields.issubset(data)
 
 
-class CategoryView(ListAPIView):
+class CategoryView(ReplicaReadMixin, CachedListMixin, ListAPIView):
     '''
     Класс для просмотра списка категорий
     '''
@@ -120,7 +172,7 @@ class CategoryView(ListAPIView):
     serializer_class = CategorySerializer
 
 
-class ShopView(ListAPIView):
+class ShopView(ReplicaReadMixin, CachedListMixin, ListAPIView):
     """
     Класс для просмотра списка магазинов
     """
@@ -136,24 +188,107 @@ class ProductView(ListAPIView):
     serializer_class = ProductSerializer
 
 
-class ProductInfoView(APIView):
+class ProductInfoView(ReplicaReadMixin, CachedListMixin, ListAPIView):
     """
-    Класс для просмотра информации о товаре
+    Класс для просмотра информации о товаре.
+
+    При CATALOG_READ_MODEL = True список читается одним запросом из каталога для чтения (CatalogEntry),
+    иначе строки values() сериализуются без моделей через FastProductInfoSerializer.
+    Фильтры по параметрам: param=Название:значение, param_min=Название:число, param_max=Название:число;
+    по цене и наличию: price_min, price_max, in_stock=1; сортировка ordering=price|-price|quantity;
+    facets=1 добавляет в ответ количество предложений по значениям параметров.
     """
-    def get(self, request: Request, *args, **kwargs):
+    pagination_class = ProductInfoCursorPagination
+    cache_params = ('shop_id', 'category_id', 'cursor', 'page_size', 'param', 'param_min', 'param_max', 'facets',
+                    'price_min', 'price_max', 'in_stock', 'ordering')
+    cache_by_shop = True
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.filters, self.parameter_filters = parse_product_filters(request.query_params)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        return super().get(request, *args, **kwargs)
+
+    def get_serializer_class(self):
+        if settings.CATALOG_READ_MODEL:
+            return CatalogEntrySerializer
+        return FastProductInfoSerializer
+
+    def get_queryset(self):
+        shop_id = self.request.query_params.get('shop_id')
+        category_id = self.request.query_params.get('category_id')
+
+        if settings.CATALOG_READ_MODEL:
+            queryset = CatalogEntry.objects.filter(shop_state=True)
+            if shop_id:
+                queryset = queryset.filter(shop_id=shop_id)
+            if category_id:
+                queryset = queryset.filter(category_id=category_id)
+            return filter_by_parameters(queryset.filter(**self.filters), self.parameter_filters, 'pk')
+
         query = Q(shop__state=True)
-        shop_id = request.query_params.get('shop_id')
-        category_id = request.query_params.get('category_id')
 
         if shop_id:
             query = query & Q(shop_id=shop_id)
-        
+
         if category_id:
-            query = query & Q(category_id=category_id)
-        
-        queryset = ProductInfo.objects.filter(query).select_related('shop', 'product__category').prefetch_related('product_parameters__parameter').distinct()
-        serializer = ProductInfoSerializer(queryset, many=True)
-        return Response(serializer.data)
+            query = query & Q(product__category_id=category_id)
+
+        queryset = ProductInfo.objects.filter(query, **self.filters).values('pk', *PRODUCT_INFO_FIELDS)
+        return filter_by_parameters(queryset, self.parameter_filters, 'pk')
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.request.query_params.get('facets') in ('1', 'true', 'yes'):
+            product_info_ids = self.get_queryset().values('pk') if self.parameter_filters or self.filters else None
+            response.data['facets'] = facet_counts(product_info_ids,
+                                                   shop_id=self.request.query_params.get('shop_id'),
+                                                   category_id=self.request.query_params.get('category_id'))
+        return response
+
+
+class ProductSearchView(CachedListMixin, ListAPIView):
+    """
+    Класс для полнотекстового поиска предложений по названию, модели и значениям параметров
+    """
+    serializer_class = CatalogEntrySerializer
+    pagination_class = SearchPagination
+    cache_params = ('q', 'shop_id', 'category_id', 'page', 'page_size')
+    cache_by_shop = True
+
+    def get(self, request, *args, **kwargs):
+        if not search_terms(request.query_params.get('q', '')):
+            return JsonResponse({'Status': False, 'Errors': 'Не указан поисковый запрос'}, status=400)
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return SearchResults(self.request.query_params['q'],
+                             shop_id=self.request.query_params.get('shop_id'),
+                             category_id=self.request.query_params.get('category_id'))
+
+
+class ProductExportView(APIView):
+    """
+    Класс для потоковой выгрузки каталога активных магазинов в JSON Lines или CSV
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        export_format = request.query_params.get('export_format', 'jsonl')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный формат выгрузки: {export_format}'},
+                                status=400)
+        compress = request.query_params.get('gzip') in ('1', 'true', 'yes')
+
+        rows = export_entries(request.query_params.get('shop_id'), request.query_params.get('category_id'),
+                              settings.CATALOG_EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(iter_export(rows, export_format, compress),
+                                         content_type='application/gzip' if compress else EXPORT_FORMATS[export_format])
+        file_name = f'catalog.{export_format}.gz' if compress else f'catalog.{export_format}'
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+        return response
 
 
 class BasketView(APIView):
@@ -164,14 +299,9 @@ class BasketView(APIView):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
         
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).distinct()
-        
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
+        basket = Order.objects.filter(user_id=request.user.id, state='basket')
+
+        return Response(serialize_orders(basket))
 
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -180,26 +310,22 @@ class BasketView(APIView):
         items_string = request.data.get('items')
         if items_string:
             try:
-                items_dict = load_json(items_string)
+                items = load_json(items_string)
             except ValueError:
                 return JsonResponse({'Status': False, 'Errors': 'Invalid request format'})
-            else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-                objects_created = 0
-                for order_item in items_dict:
-                    order_item.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                            objects_created += 1
-                        except IntegrityError as error:
-                            return JsonResponse({'Status': False, 'Errors': str(error)})
-                    else:
-                        return JsonResponse({'Status': False, 'Errors': serializer.errors})
-
-                return JsonResponse({'Status': True, 'Objects created': objects_created})
-        
+            try:
+                quantities = parse_basket_items(items)
+            except ValueError as error:
+                return JsonResponse({'Status': False, 'Errors': str(error)})
+
+            errors = check_stock(quantities)
+            if errors:
+                return JsonResponse({'Status': False, 'Errors': errors})
+
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+            created, updated = add_basket_items(basket, quantities)
+            return JsonResponse({'Status': True, 'Objects created': created, 'Objects updated': updated})
+
         return JsonResponse({'Status': False, 'Errors': 'Not all required arguments are provided'})
 
     def delete(self, request, *args, **kwargs):
@@ -218,7 +344,8 @@ class BasketView(APIView):
                     objects_deleted = True
 
             if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
+                with deferred_order_totals():
+                    deleted_count = OrderItem.objects.filter(query).delete()[0]
                 return JsonResponse({'Status': True, 'Objects deleted': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Not all required arguments are provided'})
 
@@ -228,18 +355,11 @@ class BasketView(APIView):
 
         items_data = request.data.get('items')
         if items_data:
-            objects_updated = 0
-            for item in items_data:
-                item_id = item.get('id')
-                quantity = item.get('quantity')
-                if item_id and quantity:
-                    try:
-                        order_item = OrderItem.objects.get(id=item_id, order__user=request.user)
-                        order_item.quantity = quantity
-                        order_item.save()
-                        objects_updated += 1
-                    except OrderItem.DoesNotExist:
-                        return Response({'Status': False, 'Error': f'Order item with id {item_id} does not exist'}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(items_data, list):
+                return Response({'Status': False, 'Error': 'Invalid request format'}, status=status.HTTP_400_BAD_REQUEST)
+            objects_updated, errors = update_basket_items(request.user, items_data)
+            if errors:
+                return Response({'Status': False, 'Errors': errors}, status=status.HTTP_400_BAD_REQUEST)
             return Response({'Status': True, 'Objects updated': objects_updated})
         else:
             return Response({'Status': False, 'Error': 'Not all required arguments are provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -269,7 +389,13 @@ class PartnerState(APIView):
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                state = strtobool(state)
+                shops = Shop.objects.filter(user_id=request.user.id)
+                with transaction.atomic():
+                    shops.update(state=state)
+                    set_shop_state(shops, state)
+                    for shop_id in shops.values_list('id', flat=True):
+                        bump_shop(shop_id)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -277,9 +403,9 @@ class PartnerState(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class PartnerOrders(APIView):
+class PartnerImportStatus(APIView):
     """
-    Класс для получения списка заказов партнера
+    Класс для получения состояния импорта прайса партнера
     """
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -288,31 +414,83 @@ class PartnerOrders(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        order = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        runs = ImportRun.objects.filter(user_id=request.user.id)
+        run_id = request.query_params.get('id')
+        if run_id:
+            if not run_id.isdigit():
+                return JsonResponse({'Status': False, 'Error': 'Неправильно указан ИД импорта'}, status=400)
+            runs = runs.filter(id=run_id)
+        run = runs.first()
+        if run is None:
+            return JsonResponse({'Status': False, 'Error': 'Импорт не найден'}, status=404)
+
+        data = ImportRunSerializer(run).data
+        if run.state == 'running':
+            progress = load_progress(run.id)
+            if progress and progress['rows'] > data['rows']:
+                data.update(progress)
+        return Response(data)
+
+
+class PartnerOrders(ReplicaReadMixin, APIView):
+    """
+    Класс для получения списка заказов партнера.
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+    Заказы магазина читаются постранично по курсору из ShopOrder по индексу (магазин, статус, дата),
+    state отбирает заказы по статусу. В ordered_items только позиции магазина, total_sum - их сумма
+    на момент оформления, как и в других списках заказов сумма совпадает с перечисленными позициями.
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-class OrderView(APIView):
+        shop_orders = ShopOrder.objects.filter(shop__user_id=request.user.id)
+        state = request.query_params.get('state')
+        if state:
+            if state not in ORDER_STATES:
+                return JsonResponse({'Status': False, 'Errors': f'Неизвестный статус заказа: {state}'}, status=400)
+            shop_orders = shop_orders.filter(state=state)
+
+        paginator = ShopOrderCursorPagination()
+        page = paginator.paginate_queryset(shop_orders.only('order_id', 'dt', 'total_sum'), request, view=self)
+        totals = {shop_order.order_id: shop_order.total_sum for shop_order in page}
+        shop_ids = Shop.objects.filter(user_id=request.user.id).values('id')
+        orders = {order['id']: order for order in serialize_orders(Order.objects.filter(id__in=totals),
+                                                                   shop_ids=shop_ids)}
+        for order_id, total_sum in totals.items():
+            orders[order_id]['total_sum'] = total_sum
+        return paginator.get_paginated_response([orders[order_id] for order_id in totals])
+
+
+class PartnerOrderCounts(ReplicaReadMixin, APIView):
+    """
+    Класс для получения количества заказов партнера по статусам
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        counts = ShopOrder.objects.filter(shop__user_id=request.user.id) \
+            .values_list('state').annotate(total=Count('id')).order_by()
+        return JsonResponse({'Status': True, 'counts': dict(counts)})
+
+
+class OrderView(ReplicaReadMixin, APIView):
     """
     Класс для получения и размещения заказов пользователями
     """
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        order = Order.objects.filter(user_id=request.user.id).exclude(state='basket')
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return Response(serialize_orders(order))
 
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -321,16 +499,29 @@ class OrderView(APIView):
         if {'id', 'contact'}.issubset(request.data):
             if request.data['id'].isdigit():
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id']).update(
-                        contact_id=request.data['contact'],
-                        state='new')
-                except IntegrityError as error:
+                    errors = place_order(request.user.id, request.data['id'], request.data['contact'])
+                except (IntegrityError, ValueError) as error:
                     print(error)
                     return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
                 else:
-                    if is_updated:
+                    if errors:
+                        return JsonResponse({'Status': False, 'Errors': errors}, status=409)
+                    if errors is not None:
                         new_order.send(sender=self.__class__, user_id=request.user.id)
                         return JsonResponse({'Status': True})
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+
+class CatalogCacheStats(APIView):
+    """
+    Класс для просмотра попаданий и промахов кеша ответов каталога
+    """
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if not request.user.is_staff:
+            return JsonResponse({'Status': False, 'Error': 'Только для администраторов'}, status=403)
+
+        return JsonResponse(cache_stats())
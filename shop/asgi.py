@@ -3,6 +3,13 @@ ASGI config for shop project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Async views (api/v1/async/...) are served without a thread per request only under ASGI:
+
+    uvicorn shop.asgi:application --host 0.0.0.0 --port 8001
+
+One uvicorn worker keeps many slow clients in flight on a single event loop;
+run several workers (--workers N) to use more CPU cores.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -11,6 +18,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopsettings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop.settings')
 
 application = get_asgi_application()
@@ -1,10 +1,19 @@
+import functools
+import time
+
 from celery import shared_task
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from requests import get
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from yaml import load as load_yaml, Loader
 
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Contact
+from backend.catalog_cache import bump_shop
+from backend.facets import deferred_facets, rebuild_facets
+from backend.feeds import detect_format, fetch_feed, iter_feed, iter_feed_records, validate_good
+from backend.importer import PriceListImporter, save_progress
+from backend.models import ImportRun, PriceListState
 from users.models import User
 
 @shared_task
@@ -16,42 +25,195 @@ def send_email(subject, message, recipient_list):
     email.send()
 
 @shared_task
-def do_import(url, user_id):
+def do_import(url, user_id, streaming=True, mode='upsert', force=False, sharded=None, run_id=None,
+              feed_format=None):
     """
     Celery task to perform the import task asynchronously.
+
+    The feed is fetched with conditional headers remembered for the shop and
+    hashed while it is downloaded; when the server answers 304 or the content
+    digest matches the previous import, parsing and database work are skipped
+    (pass force=True to import anyway).
+    In streaming mode the downloaded feed is parsed record by record, so worker
+    memory does not grow with the feed size.
+    The default 'upsert' mode writes only added and changed offers and keeps
+    offers missing from the feed out of stock (quantity 0), so basket and order
+    items are not deleted with them; 'replace' deletes the shop's offers and
+    recreates them.
+    Feeds of at least IMPORT_SHARD_MIN_SIZE bytes (or any feed with
+    sharded=True) are imported in parallel chunks, see import_sharded.
+    Progress, phase timings and errors are recorded in the ImportRun run_id
+    (created when not given).
+    YAML, JSON Lines and CSV feeds are accepted; unless feed_format is given
+    the format is detected from the Content-Type or the url extension.
     """
     user = User.objects.get(id=user_id)
 
+    if run_id is None:
+        run_id = ImportRun.objects.create(user_id=user.id, url=url).id
+
     if user.type != 'shop':
+        update_run(run_id, state='failed', errors='Only shops can import data',
+                   finished_at=timezone.now())
         print('Only shops can import data')
         return
 
-    stream = get(url).content
-    data = load_yaml(stream, Loader=Loader)
+    update_run(run_id, state='running', started_at=timezone.now())
+    try:
+        return import_feed(run_id, url, user, streaming, mode, force, sharded, feed_format)
+    except Exception as error:
+        update_run(run_id, state='failed', errors=f'{type(error).__name__}: {error}',
+                   finished_at=timezone.now())
+        raise
+
+
+def update_run(run_id, **fields):
+    """
+    Update an ImportRun row without loading it.
+    """
+    ImportRun.objects.filter(id=run_id).update(updated_at=timezone.now(), **fields)
+
+
+def import_feed(run_id, url, user, streaming, mode, force, sharded, feed_format):
+    """
+    Fetch and import a feed for do_import, recording the outcome in the run.
+    """
+    state = None if force else PriceListState.objects.filter(shop__user_id=user.id).first()
+    started = time.monotonic()
+    download = fetch_feed(url, state)
+    fetch_seconds = round(time.monotonic() - started, 3)
+    if not download.changed:
+        if download.decision == 'unchanged':
+            PriceListState.objects.filter(id=state.id).update(etag=download.etag,
+                                                              last_modified=download.last_modified)
+        update_run(run_id, state='skipped', shop_id=state.shop_id,
+                   fetch=download.summary(), phases={'fetch': fetch_seconds},
+                   finished_at=timezone.now())
+        print(f'Import skipped: feed {download.decision}, {download.size} bytes saved')
+        return {'run': run_id, 'fetch': download.summary(), 'phases': {'fetch': fetch_seconds}}
+
+    feed_format = feed_format or detect_format(url, download.content_type)
+    if sharded is None:
+        sharded = download.size >= settings.IMPORT_SHARD_MIN_SIZE
+    if sharded:
+        with download.file:
+            return import_sharded(run_id, user.id, download, feed_format, mode, fetch_seconds)
+
+    importer = PriceListImporter(user.id, mode=mode, progress=functools.partial(save_progress, run_id))
+    with download.file:
+        if streaming or feed_format != 'yaml':
+            result = importer.run(iter_feed(download.file, feed_format))
+        else:
+            data = load_yaml(download.file, Loader=Loader)
+            result = importer.run(iter_feed_records(data))
+
+    PriceListState.objects.update_or_create(shop_id=importer.shop.id,
+                                            defaults=dict(download.state_fields(), url=url))
+    result['run'] = run_id
+    result['fetch'] = download.summary()
+    result['phases']['fetch'] = fetch_seconds
+    update_run(run_id, state='success', shop_id=importer.shop.id, rows=result['rows'],
+               added=result['added'], changed=result['changed'],
+               removed=result['removed'], fetch=result['fetch'],
+               phases=result['phases'], finished_at=timezone.now())
 
-    shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user.id)
-    for category in data['categories']:
-        category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-        category_object.shops.add(shop.id)
-        category_object.save()
+    print(f"Import completed successfully: {result['rows']} rows, {result['rows_per_second']} rows/s, "
+          f"added {result['added']}, changed {result['changed']}, removed {result['removed']}")
+    return result
 
-    ProductInfo.objects.filter(shop_id=shop.id).delete()
 
-    for item in data['goods']:
-        product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
+def import_sharded(run_id, user_id, download, feed_format, mode, fetch_seconds):
+    """
+    Split a downloaded feed into chunks of IMPORT_CHUNK_SIZE goods imported by
+    parallel import_goods_chunk tasks.
+
+    Shop, categories, products and parameters are created in a first pass so
+    the chunks never race on them. Chunks are dispatched one by one as they
+    are read, so the whole feed is never held in memory; the chunk that
+    completes the run hands over to finalize_import.
+    """
+    chunk_size = settings.IMPORT_CHUNK_SIZE
+    importer = PriceListImporter(user_id, mode=mode)
+    prepared = importer.prepare(iter_feed(download.file, feed_format))
+    chunks = -(-prepared['goods'] // chunk_size)
+    update_run(run_id, shop_id=prepared['shop_id'],
+               state='running' if chunks else 'finalizing',
+               chunks=chunks, pending_chunks=chunks,
+               removed=importer.removed, removed_ids=prepared['removed'],
+               fetch=dict(download.summary(), **download.state_fields()),
+               phases=dict(importer.phase_stats(), fetch=fetch_seconds))
+    if not chunks:
+        finalize_import.delay(run_id, mode)
+        return {'run': run_id, 'chunks': 0, 'fetch': download.summary()}
+
+    download.file.seek(0)
+    seen = set()
+    chunk = []
+    for kind, item in iter_feed(download.file, feed_format):
+        if kind != 'good':
+            continue
+        item = validate_good(item)
+        if item['id'] in seen:
+            continue
+        seen.add(item['id'])
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            import_goods_chunk.delay(run_id, chunk, mode)
+            chunk = []
+    if chunk:
+        import_goods_chunk.delay(run_id, chunk, mode)
+
+    print(f"Import dispatched: {prepared['goods']} goods in {chunks} chunks")
+    return {'run': run_id, 'chunks': chunks, 'fetch': download.summary()}
+
+
+@shared_task
+def import_goods_chunk(run_id, goods, mode='upsert'):
+    """
+    Celery task to import one chunk of a sharded feed.
+    """
+    run = ImportRun.objects.select_related('shop').get(id=run_id)
+    try:
+        result = PriceListImporter(run.user_id, mode=mode).run_chunk(run.shop, goods)
+    except Exception as error:
+        update_run(run_id, state='failed', errors=f'{type(error).__name__}: {error}',
+                   finished_at=timezone.now())
+        raise
+
+    update_run(run_id, pending_chunks=F('pending_chunks') - 1,
+               rows=F('rows') + result['rows'],
+               added=F('added') + result['added'],
+               changed=F('changed') + result['changed'])
+    if ImportRun.objects.filter(id=run_id, state='running', pending_chunks=0).update(state='finalizing'):
+        finalize_import.delay(run_id, mode)
+    return result
 
-        product_info = ProductInfo.objects.create(product_id=product.id,
-                                                  external_id=item['id'],
-                                                  model=item['model'],
-                                                  price=item['price'],
-                                                  price_rrc=item['price_rrc'],
-                                                  quantity=item['quantity'],
-                                                  shop_id=shop.id)
 
-        for name, value in item['parameters'].items():
-            parameter_object, _ = Parameter.objects.get_or_create(name=name)
-            ProductParameter.objects.create(product_info_id=product_info.id,
-                                            parameter_id=parameter_object.id,
-                                            value=value)
+@shared_task
+def finalize_import(run_id, mode='upsert'):
+    """
+    Celery task to finish a sharded import: take offers missing from the feed
+    out of stock and remember the feed state, in one transaction.
+    """
+    run = ImportRun.objects.select_related('shop').get(id=run_id)
+    importer = PriceListImporter(run.user_id, mode=mode)
+    importer.shop = run.shop
+    with transaction.atomic(), deferred_facets():
+        importer.remove_missing(run.removed_ids)
+        rebuild_facets(run.shop_id)
+        bump_shop(run.shop_id)
+        PriceListState.objects.update_or_create(
+            shop_id=run.shop_id,
+            defaults={'url': run.url, **{field: run.fetch.get(field) for field in
+                                         ('etag', 'last_modified', 'digest', 'size')}})
+        run.removed += importer.removed
+        run.removed_ids = []
+        run.state = 'success'
+        run.finished_at = timezone.now()
+        run.save()
 
-    print('Import completed successfully')
+    elapsed = (run.finished_at - run.started_at).total_seconds()
+    print(f"Import completed successfully: {run.rows} rows in {run.chunks} chunks, "
+          f"{round(run.rows / elapsed, 1) if elapsed else run.rows} rows/s, "
+          f"added {run.added}, changed {run.changed}, removed {run.removed}")
+    return {'run': run.id, 'rows': run.rows, 'added': run.added, 'changed': run.changed, 'removed': run.removed}